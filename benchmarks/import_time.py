@@ -0,0 +1,57 @@
+'''
+PassportEye: Import time benchmark.
+
+Measures the time it takes to import the main modules of the package, each in a fresh interpreter process.
+Run from the root of the source distribution as:
+
+    $ python benchmarks/import_time.py [-n repeats]
+
+The heavy dependencies (scikit-image, scikit-learn, matplotlib, PDFMiner, pytesseract) are only loaded
+by the modules (or functions) which actually need them. Sample results (seconds, best of 5, Python 2.7, skimage 0.14),
+before and after making the imports lazy:
+
+    Statement                           Before   After
+    import passporteye                   0.787   0.000
+    import passporteye.mrz.text          0.687   0.060
+    import passporteye.util.ocr          0.820   0.012
+    import passporteye.mrz.scripts       0.783   0.136
+    import passporteye.mrz.image         0.740   0.618
+
+Note that the MRZ pipeline itself (passporteye.mrz.image) still needs scikit-image, which accounts for most of its import time,
+and most of the remaining import time of passporteye.mrz.scripts is spent importing pkg_resources.
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import argparse, os, subprocess, sys
+
+STATEMENTS = ['import passporteye',
+              'import passporteye.mrz.text',
+              'import passporteye.util.ocr',
+              'import passporteye.mrz.scripts',
+              'import passporteye.mrz.image']
+
+TIMER = "import time; _t = time.time(); %s; print(time.time() - _t)"
+
+
+def import_time(statement, repeats=5):
+    """Returns the smallest time (in seconds) it took to execute the given statement in a fresh Python process."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for i in range(repeats):
+        output = subprocess.check_output([sys.executable, '-c', TIMER % statement], cwd=root)
+        times.append(float(output.decode('ascii').strip().split()[-1]))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of PassportEye modules.')
+    parser.add_argument('-n', '--repeats', default=5, type=int, help='Number of measurements per statement')
+    args = parser.parse_args()
+    print("%-35s %s" % ("Statement", "Time"))
+    for statement in STATEMENTS:
+        print("%-35s %0.3f" % (statement, import_time(statement, args.repeats)))
+
+
+if __name__ == '__main__':
+    main()
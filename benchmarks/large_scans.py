@@ -0,0 +1,102 @@
+'''
+PassportEye: memory use on large scans.
+
+Renders a synthetic 600 dpi A4 page (4960 x 7016 pixels) with an MRZ at its bottom, as well as an A2 page (four times
+the area) with the same MRZ, saves them as uncompressed TIFFs, LZW-compressed TIFFs and JPEGs, and runs read_mrz on each
+of them in a fresh process with the default float64 image, with dtype=np.uint8 and with mmap=True, reporting the
+peak RSS of the process (the tesseract processes are not counted) and the time taken.
+Run from the root of the source distribution as:
+
+    $ python benchmarks/large_scans.py [--dir directory]
+
+Sample results (Python 2.7, scikit-image 0.14, Linux):
+
+    File         Mode          Peak RSS, MB  Time, s
+    a4.tif       default               1258     1.64
+    a4.tif       dtype=uint8            296     0.92
+    a4.tif       mmap                   168     0.96
+    a4-lzw.tif   default               1258     1.80
+    a4-lzw.tif   dtype=uint8            296     1.37
+    a4-lzw.tif   mmap                   339     1.60
+    a4.jpg       default               1259     2.28
+    a4.jpg       dtype=uint8            429     1.38
+    a4.jpg       mmap                   244     1.59
+    a2.tif       default               4743     5.60
+    a2.tif       dtype=uint8            893     2.71
+    a2.tif       mmap                   262     2.73
+    a2-lzw.tif   default               4738     6.16
+    a2-lzw.tif   dtype=uint8            893     2.84
+    a2-lzw.tif   mmap                  1037     4.83
+    a2.jpg       default               4743     8.35
+    a2.jpg       dtype=uint8           1425     4.72
+    a2.jpg       mmap                   642     4.28
+
+About 100 MB of each figure is the memory of the process after importing the libraries. With mmap, the memory
+allocated by the pipeline itself does not depend on the size of the page: the growth for the uncompressed A2 page
+consists of the pages of the (temporary) file mapped around the rows sampled by Scaler, which the system may reclaim
+at any time. For compressed files the peak is that of PIL decoding the whole image, which can not be done in parts
+(and takes about 7 bytes per pixel for LZW-compressed TIFFs, more than the TIFF reader of scikit-image).
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = [('default', {}), ('dtype=uint8', {'dtype': np.uint8}), ('mmap', {'mmap': True})]
+
+
+def make_pages(directory, width=4960, height=7016):
+    """Writes the sample pages in the three formats to the directory, returns the list of filenames."""
+    from PIL import Image
+    from passporteye.mrz.synthetic import random_mrz_lines, render_mrz
+    mrz = render_mrz(random_mrz_lines('TD3', np.random.RandomState(0)), np.random.RandomState(0), width=width*2//3,
+                     rotation=1.0, noise=0.05)
+    page = np.ones((height, width))
+    r, c = height - mrz.shape[0] - height//20, (width - mrz.shape[1])//2
+    page[r:r + mrz.shape[0], c:c + mrz.shape[1]] = mrz
+    a4 = Image.fromarray((page*255).astype(np.uint8)).convert('RGB')
+    a2 = Image.new('RGB', (width*2, height*2), (255, 255, 255))
+    a2.paste(a4, (width, height))
+    filenames = []
+    for name, im in [('a4', a4), ('a2', a2)]:
+        for fn, params in [('%s.tif', {}), ('%s-lzw.tif', {'compression': 'tiff_lzw'}), ('%s.jpg', {'quality': 90})]:
+            filenames.append(os.path.join(directory, fn % name))
+            im.save(filenames[-1], **params)
+    return filenames
+
+
+def run(filename, mode):
+    """Runs read_mrz in the given mode, prints the peak RSS and the time taken as JSON."""
+    from PIL import Image
+    from passporteye import read_mrz
+    Image.MAX_IMAGE_PIXELS = None  # The A2 page is larger than PIL's limit
+    tic = time.time()
+    read_mrz(filename, **dict(MODES)[mode])
+    walltime = time.time() - tic
+    unit = 1024.0 if sys.platform != 'darwin' else 1024.0**2  # ru_maxrss is in kilobytes on Linux, in bytes on Mac OS
+    print(json.dumps({'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/unit, 'walltime': walltime}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory use of read_mrz on large scans.')
+    parser.add_argument('--dir', help='Directory for the sample files (a temporary one by default)')
+    parser.add_argument('--run', nargs=2, metavar=('FILE', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        return run(*args.run)
+
+    directory = args.dir or tempfile.mkdtemp()
+    filenames = make_pages(directory)
+    print("%-12s %-12s %13s %8s" % ("File", "Mode", "Peak RSS, MB", "Time, s"))
+    for fn in filenames:
+        for mode, params in MODES:
+            # A fresh process for each run, so that the peak RSS is its own
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', fn, mode])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            print("%-12s %-12s %13.0f %8.2f" % (os.path.basename(fn), mode, result['peak_rss_mb'], result['walltime']))
+
+
+if __name__ == '__main__':
+    main()
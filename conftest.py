@@ -0,0 +1,12 @@
+'''
+Configuration for py.test.
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # Relies on the async/await syntax
+    collect_ignore.append('passporteye/mrz/aio.py')
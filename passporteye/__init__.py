@@ -7,4 +7,9 @@ License: MIT
 
 __version__ = "1.0.1"
 
-from passporteye.mrz.image import read_mrz
+
+def read_mrz(*args, **kwargs):
+    """A shortcut for passporteye.mrz.image.read_mrz (see its documentation).
+    The image processing libraries are only imported on the first call, so that `import passporteye` stays cheap."""
+    from passporteye.mrz.image import read_mrz
+    return read_mrz(*args, **kwargs)
@@ -0,0 +1,125 @@
+'''
+PassportEye::MRZ: Machine-readable zone extraction and parsing.
+The asyncio interface to the recognition (Python 3.5+).
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import asyncio, concurrent.futures, functools, multiprocessing, threading, weakref
+from ..util.ocr import OCRTimeoutError, OCRCancelledError, _piped_command, _piped_output, _tesseract_error
+
+# The maximum number of tesseract processes run at once by ocr_async (and hence by all read_mrz_async calls)
+# on an event loop. Must be set before the first OCR call on the loop.
+OCR_CONCURRENCY = multiprocessing.cpu_count()
+
+_limiters = weakref.WeakKeyDictionary()  # Event loop -> its OCR semaphore
+
+
+def ocr_limiter(loop=None):
+    """Returns the semaphore limiting the number of concurrent tesseract processes on the given (by default, the current)
+    event loop to OCR_CONCURRENCY."""
+    loop = loop or asyncio.get_event_loop()
+    if loop not in _limiters:
+        _limiters[loop] = asyncio.Semaphore(OCR_CONCURRENCY)
+    return _limiters[loop]
+
+
+async def ocr_async(img, mrz_mode=True, timeout=None):
+    """Same as util.ocr.ocr(img, mrz_mode, in_memory=True, timeout=timeout), but runs tesseract as an asyncio
+    subprocess. At most OCR_CONCURRENCY tesseract processes run at once, the rest of the calls wait for their turn
+    (the timeout includes the waiting time).
+
+    If the call is cancelled, the tesseract process is killed.
+    """
+    command, input_data = _piped_command(img, mrz_mode)
+    return _piped_output(await _run_tesseract_async(command, input_data, timeout))
+
+
+async def _run_tesseract_async(command, input_data, timeout=None):
+    """The asyncio version of util.ocr._run_tesseract: runs the tesseract command line (once the OCR semaphore allows it),
+    killing it after `timeout` seconds or if cancelled. Returns the contents of its stdout."""
+    try:
+        return await asyncio.wait_for(_run_limited(command, input_data), timeout)
+    except asyncio.TimeoutError:
+        raise OCRTimeoutError("OCR did not complete in %0.2fs" % timeout)
+
+
+async def _run_limited(command, input_data):
+    async with ocr_limiter():
+        proc = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            output, error_string = await proc.communicate(input_data)
+        finally:
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass  # The process has just completed by itself
+                await proc.wait()
+    if proc.returncode:
+        raise _tesseract_error(proc.returncode, error_string)
+    return output
+
+
+class _LoopOCREngine(object):
+    """An OCR engine (see util.ocr.ocr) for a read_mrz call running in a worker thread:
+    the OCR is done by ocr_async on the given event loop, and may be cancelled from there."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._cancelled = False
+
+    def ocr(self, img, mrz_mode=True, timeout=None):
+        command, input_data = _piped_command(img, mrz_mode)  # The image is encoded here rather than on the loop
+        future = asyncio.run_coroutine_threadsafe(_run_tesseract_async(command, input_data, timeout), self.loop)
+        with self._lock:
+            self._futures.add(future)
+            if self._cancelled:
+                future.cancel()
+        try:
+            return _piped_output(future.result())
+        except (concurrent.futures.CancelledError, asyncio.CancelledError):
+            raise OCRCancelledError("OCR cancelled")
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+
+    def cancel(self):
+        """Cancels (and kills the tesseract processes of) the running OCR calls, as well as all the subsequent ones."""
+        with self._lock:
+            self._cancelled = True
+            for future in self._futures:
+                future.cancel()
+
+
+async def read_mrz_async(filename, save_roi=False, hooks=(), deadline=None, ocr_workers=1, cache=None, ocr_memo=None,
+                         executor=None, jpeg_draft=False, dtype=None, mmap=False):
+    """The asyncio version of read_mrz (see its documentation for the parameters).
+
+    The image processing runs in the given concurrent.futures executor (by default, the default executor of the loop),
+    while the OCR is done by tesseract processes run on the event loop itself (see ocr_async),
+    so that their number is limited by OCR_CONCURRENCY across all concurrent read_mrz_async calls.
+
+    When the call is cancelled, the running tesseract processes are killed and no more OCR is started.
+    The image processing step which is running at the moment completes in the background.
+
+    :param executor: the concurrent.futures executor for the image processing. Note that with ocr_workers > 1 each call
+                     also starts its own OCR threads.
+    """
+    from .image import read_mrz  # Not at the top: mrz.image imports this module
+    loop = asyncio.get_event_loop()
+    engine, cancel = _LoopOCREngine(loop), threading.Event()
+    future = loop.run_in_executor(executor, functools.partial(read_mrz, filename, save_roi, engine, hooks, deadline,
+                                                              ocr_workers, cache, ocr_memo, cancel, jpeg_draft, dtype,
+                                                              mmap))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel.set()
+        engine.cancel()
+        # The abandoned call may still fail, which is of no interest to anyone
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
@@ -5,54 +5,286 @@ Image processing for MRZ extraction.
 Author: Konstantin Tretyakov
 License: MIT
 '''
-from skimage import transform, io, morphology, filters, measure
+from skimage import transform, io, morphology, filters, measure, color, img_as_float
 import numpy as np
-import tempfile, os
-from ..util.pdf import extract_first_jpeg_in_pdf
+from scipy import ndimage
+import os, sys, time, threading, traceback, multiprocessing, hashlib, copy, tempfile, pickle
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from collections import namedtuple
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 from ..util.pipeline import Pipeline
 from ..util.geometry import RotatedBox
-from ..util.ocr import ocr
+from ..util import morphology as fast_morphology
+from ..util.ocr import ocr, ocr_key, TesseractEngine, OCRTimeoutError, OCRCancelledError
+from ..util.cache import MemoryCache
 from .text import MRZ
 
 
 class Loader(object):
-    """Loads `filename` to `img`."""
+    """Loads `filename` to `img`.
+
+    The source may be given as a filename, the contents of an image or PDF file (bytes), a readable binary stream
+    (e.g. an uploaded file), or an already decoded image (a numpy ndarray). Nothing is written to disk in either case.
+    Note that in Python 2, where bytes and str are the same, data must start with the signature of an image or a PDF file
+    (or be given as a bytearray) to not be mistaken for a filename.
+
+    If the filename is None, the source is taken from the `filename` pipeline input instead (see MRZPipeline.run).
+
+    By default (dtype=None) the image is as given by skimage.io.imread, i.e. color images become float64 grey levels in [0, 1]
+    (8 bytes per pixel), while greyscale ones keep their pixel type. With dtype=np.uint8 (grey levels 0..255)
+    or dtype=np.float32 (grey levels in [0, 1]) the image takes 8 or 2 times less memory, and is converted without
+    making double precision copies of it along the way. The rest of the pipeline works with any of those.
+
+    With mmap=True the image (of the given dtype, np.uint8 by default) is not held in memory, but memory-mapped:
+    uncompressed 8-bit images (e.g. raw TIFFs) are mapped directly from the file, others are decoded, converted to grey
+    band by band and written to an anonymous temporary file, which is mapped instead (see _map_image). The parts of
+    the image are then only read into memory when they are accessed, i.e. the rows sampled by Scaler and the window
+    under a candidate box (see RotatedBox.extract_from_image), so the memory of the pipeline does not grow with the size
+    of the scan. Note that PIL still decodes compressed images in full before they are converted (as 1-4 bytes per pixel).
+    """
 
     __depends__ = []
     __provides__ = ['img']
 
-    def __init__(self, filename, as_grey=True, pdf_aware=True):
+    # Signatures of the file formats, by which data is told from filenames in Python 2
+    SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG', b'%PDF', b'GIF8', b'BM', b'II*\x00', b'MM\x00*')
+
+    def __init__(self, filename, as_grey=True, pdf_aware=True, dtype=None, mmap=False):
         self.filename = filename
         self.as_grey = as_grey
         self.pdf_aware = pdf_aware
+        self.dtype = dtype
+        self.mmap = mmap
+        if filename is None:
+            self.__depends__ = ['filename']
 
     def _imread(self, filename):
-        """Proxy to skimage.io.imread with some fixes."""
-        img = io.imread(filename, as_grey=self.as_grey)
-        if img is not None and len(img.shape) != 2:
+        """Proxy to skimage.io.imread with some fixes. Accepts filenames and binary streams."""
+        if self.mmap and self.as_grey:
+            img = _map_image(filename, self.dtype or np.uint8)
+            if img is not None:
+                return img
+            if hasattr(filename, 'seek'):
+                filename.seek(0)  # Not an image PIL knows, let skimage try
+        as_grey = self.as_grey and self.dtype is None  # Otherwise we convert to grey ourselves, see _convert_image
+        img = io.imread(filename, as_grey=as_grey)
+        if img is not None and len(img.shape) != 2 and (as_grey or len(img.shape) != 3):
             # The PIL plugin somewhy fails to load some images
-            img = io.imread(filename, as_grey=self.as_grey, plugin='matplotlib')
+            if hasattr(filename, 'seek'):
+                filename.seek(0)
+            img = io.imread(filename, as_grey=as_grey, plugin='matplotlib')
+        if img is not None and self.dtype is not None:
+            img = _convert_image(img, self.as_grey, self.dtype)
         return img
 
-    def __call__(self):
-        if self.pdf_aware and self.filename.lower().endswith('.pdf'):
-            with open(self.filename, 'rb') as f:
-                img_data = extract_first_jpeg_in_pdf(f)
-            if img_data is None:
-                return None
-            else:
-                fd, fname = tempfile.mkstemp(prefix='pythoneye_', suffix='.jpg')
-                try:
-                    with open(fname, 'wb') as f:
-                        f.write(img_data)
-                    return self._imread(fname)
-                except:
-                    return None
-                finally:
-                    os.close(fd)
-                    os.remove(fname)
+    def load_draft(self, max_width, filename=None):
+        """Loads a JPEG source at a reduced resolution: returns (img_small, scale_factor) as Scaler(max_width) would
+        for the loaded image, but without decoding the image in full. The JPEG decoder is put into draft mode,
+        in which it only computes the low-frequency DCT coefficients of each block, scaling the image by 1/2, 1/4 or 1/8
+        (the smallest scale still larger than the requested size) almost for free. The result is then resized exactly.
+        Returns None if the source is not a JPEG image at least max_width pixels wide (or is not loaded as grey).
+        """
+        source = self.filename if filename is None else filename
+        if not self.as_grey or isinstance(source, np.ndarray):
+            return None
+        if _is_data(source):
+            source = BytesIO(bytes(source))
+        if not hasattr(source, 'read'):
+            with open(source, 'rb') as f:
+                return self._load_draft(f, max_width)
+        if not (hasattr(source, 'seekable') and source.seekable()) and not isinstance(source, BytesIO):
+            return None  # We would not be able to read it again for __call__
+        pos = source.tell()
+        try:
+            return self._load_draft(source, max_width)
+        finally:
+            source.seek(pos)
+
+    def _load_draft(self, f, max_width):
+        from PIL import Image
+        try:
+            im = Image.open(f)
+        except IOError:
+            return None  # Not an image PIL knows (e.g. a PDF)
+        if im.format != 'JPEG' or im.size[0] <= max_width:
+            return None
+        scale_factor = max_width/float(im.size[0])
+        shape = tuple(np.round(np.array([im.size[1], im.size[0]])*scale_factor).astype(int))
+        # Decoding at twice the target size (rather than just the target size) and in color (rather than the JPEG luma)
+        # keeps img_small close to what Scaler makes of the full image, so that the same boxes are found
+        im.draft('RGB', (2*shape[1], 2*shape[0]))
+        if im.mode == 'L':
+            img = np.asarray(im, dtype=np.float64)/255.0
+        else:
+            img = color.rgb2gray(np.asarray(im.convert('RGB')))
+        return transform.resize(img, shape), scale_factor
+
+    def __call__(self, filename=None):
+        source = self.filename if filename is None else filename
+        if isinstance(source, np.ndarray):
+            if self.dtype is not None:
+                return _convert_image(source, self.as_grey, self.dtype)
+            if self.as_grey and source.ndim == 3:
+                return color.rgb2gray(source[:, :, :3])  # Drop the alpha channel, if any
+            return source
+        if _is_data(source):
+            source = BytesIO(bytes(source))
+        if not self.pdf_aware:
+            return self._imread(source)
+        source, pdf = _open_pdf(source)
+        if pdf is None:
+            return self._imread(source)
+
+        # The first image of the PDF which we manage to decode
+        from ..util.pdf import iter_pdf_images  # PDFMiner is only loaded when needed
+        try:
+            for image in iter_pdf_images(pdf):
+                img = _load_pdf_image(image, self.as_grey, self.dtype, self.mmap)
+                if img is not None:
+                    return img
+        finally:
+            if pdf is not source:
+                pdf.close()
+        return None
+
+
+def _open_pdf(source):
+    """Checks whether the given Loader source (a filename or a binary stream) is a PDF.
+    Returns (source, pdf), where pdf is a binary stream with the PDF (to be closed by the caller if it is not source itself)
+    or None if the source is not a PDF. The source may be replaced in the process (unseekable streams are read into memory),
+    so the returned one must be used from now on."""
+    if hasattr(source, 'read'):
+        # We need to look at the data to know whether it is a PDF. Unseekable streams are read into memory first.
+        if not (hasattr(source, 'seekable') and source.seekable()) and not isinstance(source, BytesIO):
+            source = BytesIO(source.read())
+        pos = source.tell()
+        is_pdf = source.read(4) == b'%PDF'
+        source.seek(pos)
+        return source, source if is_pdf else None
+    return source, open(source, 'rb') if source.lower().endswith('.pdf') else None
+
+
+def _load_pdf_image(image, as_grey=True, dtype=None, mmap=False):
+    """Converts a util.pdf.PDFImage to an image array. Returns None if the image data could not be decoded."""
+    try:
+        return Loader(image.data if image.format == 'raw' else BytesIO(image.data), as_grey, pdf_aware=False, dtype=dtype,
+                      mmap=mmap)()
+    except Exception:
+        return None
+
+
+def _convert_image(img, as_grey, dtype):
+    """Converts an image array to grey (if as_grey, using the weights of skimage.color.rgb2gray) and to the given
+    pixel type: np.uint8 (grey levels 0..255) or np.float32 (grey levels in [0, 1]).
+    The computations are done in single precision, so no float64 copies of the image are made.
+
+    >>> rgb = np.array([[[255, 255, 255], [255, 0, 0]], [[0, 0, 0], [10, 20, 30]]], dtype=np.uint8)
+    >>> _convert_image(rgb, True, np.uint8)
+    array([[255,  54],
+           [  0,  19]], dtype=uint8)
+    >>> bool(np.abs(_convert_image(rgb, True, np.float32) - color.rgb2gray(rgb)).max() < 1e-6)
+    True
+    >>> _convert_image(np.array([[0.0, 0.5, 1.0]]), True, np.uint8)
+    array([[  0, 128, 255]], dtype=uint8)
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.uint8), np.dtype(np.float32)):
+        raise ValueError("Unsupported image dtype: %s" % dtype)
+    if img.dtype == dtype and not (as_grey and img.ndim == 3):
+        return img
+    white = float(np.iinfo(img.dtype).max) if img.dtype.kind in 'ui' else 1.0
+    result = np.empty(img.shape[:2] if as_grey else img.shape, dtype=dtype)
+    for r in range(0, img.shape[0], 256):
+        # Row by row block, so that the temporary float32 arrays are small
+        block = img[r:r + 256]
+        if as_grey and img.ndim == 3:
+            grey = np.zeros(block.shape[:2], dtype=np.float32)
+            for channel, weight in enumerate([0.2125, 0.7154, 0.0721]):
+                grey += block[:, :, channel].astype(np.float32)*np.float32(weight/white)
         else:
-            return self._imread(self.filename)
+            grey = block.astype(np.float32)*np.float32(1/white)
+        if dtype == np.uint8:
+            grey *= 255
+            grey += 0.5
+            np.clip(grey, 0, 255, out=grey)
+        result[r:r + 256] = grey
+    return result
+
+
+def _map_image(source, dtype=np.uint8, band_size=1 << 20):
+    """Loads an image (a filename or a binary stream) as a read-only memory-mapped array of grey levels of the given
+    pixel type (see Loader's mmap). Returns None if PIL can not open the image.
+    The image is converted in bands of about band_size pixels.
+
+    >>> fn = os.path.join(os.path.dirname(__file__), 'testdata', '0_id-esp.png')
+    >>> img = _map_image(fn, band_size=10000)
+    >>> img.dtype, np.array_equal(img, Loader(fn, dtype=np.uint8)())
+    (dtype('uint8'), True)
+    """
+    from PIL import Image
+    try:
+        im = Image.open(source)
+    except IOError:
+        return None
+    dtype = np.dtype(dtype)
+    w, h = im.size
+    img = _map_raw(source, im)
+    if img is not None and img.ndim == 2 and img.dtype == dtype:
+        return img  # The file itself is the image
+    # Otherwise the image is converted band by band (so that the temporary arrays are small) to the temporary file
+    band_rows = max(band_size//max(w, 1), 1)
+    with tempfile.TemporaryFile() as f:
+        for r in range(0, h, band_rows):
+            if img is not None:
+                # A mapping of its own for each band: the pages of the file read for the previous bands are then
+                # released, rather than kept as a part of the memory of the process until the end of the conversion
+                band = _map_raw(source, im)[r:r + band_rows]
+            else:
+                band = im.crop((0, r, w, min(r + band_rows, h)))  # (The first crop decodes the whole image)
+                band = np.asarray(band if band.mode in ('L', 'RGB', '1', 'I;16') else band.convert('RGB'))
+            f.write(_convert_image(band, True, dtype).tobytes())
+        f.flush()
+        # The mapping stays valid after the file is closed (and, being a temporary file, deleted)
+        return np.asarray(np.memmap(f, dtype, 'r', shape=(h, w)))
+
+
+def _map_raw(source, im):
+    """Maps the pixels of an uncompressed 8-bit grey or RGB image (e.g. a raw TIFF, PGM or BMP file), opened by PIL as `im`,
+    directly from the file. Returns None if the image is stored otherwise or the source is not a filename."""
+    if hasattr(source, 'read') or not im.tile:
+        return None
+    decoder, extents, offset, args = im.tile[0]
+    rawmode, stride, orientation = ((args if isinstance(args, tuple) else (args,)) + (0, 1))[:3]
+    channels = {'L': 1, 'RGB': 3, 'BGR': 3}.get(rawmode)
+    w, h = im.size
+    stride = stride or w*(channels or 0)
+    # The tiles (if there are several, e.g. the strips of a TIFF) must make up a single contiguous array of rows
+    if channels is None or orientation not in (1, -1) or stride < w*channels or \
+            any([t[0] != 'raw' or t[3] != args or t[1][0] != 0 or t[1][2] != w or t[2] != offset + t[1][1]*stride
+                 for t in im.tile]) or sum([t[1][3] - t[1][1] for t in im.tile]) != h:
+        return None
+    try:
+        rows = np.memmap(source, np.uint8, 'r', offset, shape=(h, stride))
+    except (ValueError, IOError, OSError):
+        return None  # E.g. a truncated file
+    img = rows[::orientation, :w*channels]
+    if channels > 1:
+        img = img.reshape((h, w, channels))[:, :, ::-1 if rawmode == 'BGR' else 1]
+    return np.asarray(img)
+
+
+def _is_data(source):
+    """Is the given read_mrz source the contents of a file (rather than a filename)?"""
+    if isinstance(source, bytearray):
+        return True
+    if not isinstance(source, bytes):
+        return False
+    # In Python 2 bytes is str, hence we have to guess
+    return bytes is not str or (source.startswith(Loader.SIGNATURES) and (b'\0' in source or not os.path.exists(source)))
 
 
 class Scaler(object):
@@ -67,13 +299,60 @@ class Scaler(object):
     def __call__(self, img):
         scale_factor = self.max_width/float(img.shape[1])
         if scale_factor <= 1:
-            img_small = transform.rescale(img, scale_factor)
+            # (The rescale of a uint8 or float32 image would make a float64 copy of all of it first)
+            img_small = transform.rescale(img, scale_factor) if img.dtype == np.float64 else _downscale(img, scale_factor)
         else:
             scale_factor = 1.0
-            img_small = img
+            img_small = img_as_float(img)  # Grey levels in [0, 1], as rescale would give (see Loader's dtype)
         return img_small, scale_factor
 
 
+def _downscale(img, scale_factor, block_rows=64):
+    """Downscales a 2D image by scale_factor <= 1 with bilinear interpolation and no anti-aliasing: each output pixel
+    center is mapped to the input coordinates and interpolated between the two nearest rows and columns.
+    The result is a float64 image of grey levels in [0, 1]. Only the rows and columns which are sampled are converted
+    to float64, a block of output rows at a time (so that, e.g., only the sampled pages of a memory-mapped image are read).
+
+    >>> img = np.random.RandomState(0).rand(500, 70)
+    >>> rescale = lambda img: transform.rescale(img, 0.3, order=1, mode='constant', anti_aliasing=False)
+    >>> bool(np.abs(_downscale(img, 0.3) - rescale(img)).max() < 1e-9)
+    True
+    >>> bool(np.abs(_downscale((img*255).astype(np.uint8), 0.3) - rescale((img*255).astype(np.uint8))).max() < 1e-9)
+    True
+    """
+    shape = np.round(np.array(img.shape)*scale_factor).astype(int)
+    samples = []
+    for n, m in zip(img.shape, shape):
+        # The output pixel centers in the input coordinates. For downscaling they never reach beyond the last pixel.
+        coords = (np.arange(m) + 0.5)*(n/float(m)) - 0.5
+        i = np.floor(coords).astype(int)
+        samples.append((i, np.minimum(i + 1, n - 1), coords - i))
+    (i1, i2, wr), (j1, j2, wc) = samples
+    result = np.empty(shape)
+    for r in range(0, shape[0], block_rows):
+        block = slice(r, r + block_rows)
+        w = wr[block].reshape((-1, 1))
+        rows = img_as_float(np.take(img, i1[block], 0))*(1 - w) + img_as_float(np.take(img, i2[block], 0))*w
+        result[block] = np.take(rows, j1, 1)*(1 - wc) + np.take(rows, j2, 1)*wc
+    return result
+
+
+class DraftScaler(Scaler):
+    """Same as Scaler, but when the source is a JPEG file, `img_small` is decoded directly at a reduced resolution
+    (see Loader.load_draft) rather than scaled down from `img`. The full resolution `img` is then only loaded
+    when it is needed, i.e. when a candidate MRZ box is found and its ROI is extracted for OCR.
+    This saves most of the decoding and scaling time (and memory) on large photos. Other sources are handled as by Scaler.
+
+    Note that the results may differ slightly from the ones with Scaler, as the images are scaled differently.
+    """
+
+    __depends__ = ['__pipeline__']  # To get to the Loader and its source without loading the image
+
+    def __call__(self, __pipeline__):
+        result = __pipeline__.components['loader'].load_draft(self.max_width, __pipeline__.data.get('filename'))
+        return result if result is not None else super(DraftScaler, self).__call__(__pipeline__['img'])
+
+
 class BooneTransform(object):
     """Processes `img_small` according to Hans Boone's method
     (http://www.pyimagesearch.com/2015/11/30/detecting-machine-readable-zones-in-passport-images/)
@@ -82,14 +361,21 @@ class BooneTransform(object):
     __depends__ = ['img_small']
     __provides__ = ['img_binary']
 
-    def __init__(self, square_size=5):
-        self.square_size = 5
+    def __init__(self, square_size=5, fast_morphology=True):
+        """
+        :param fast_morphology: when True (default), the morphological operations are done with the separable filters of
+                                util.morphology rather than with skimage.morphology. The results are exactly the same.
+        """
+        self.square_size = square_size
+        self.fast_morphology = fast_morphology
+        self._square = morphology.square(square_size)
 
     def __call__(self, img_small):
-        m = morphology.square(self.square_size)
-        img_th = morphology.black_tophat(img_small, m)
+        m = self._square
+        mo = fast_morphology if self.fast_morphology else morphology
+        img_th = mo.black_tophat(img_small, m)
         img_sob = abs(filters.sobel_v(img_th))
-        img_closed = morphology.closing(img_sob, m)
+        img_closed = mo.closing(img_sob, m)
         threshold = filters.threshold_otsu(img_closed)
         return img_closed > threshold
 
@@ -110,27 +396,52 @@ class MRZBoxLocator(object):
         self.box_type = box_type
 
     def __call__(self, img_binary):
-        cs = measure.find_contours(img_binary, 0.5)
-
         # Collect contours into RotatedBoxes
         results = []
-        for c in cs:
-            # Now examine the bounding box. If it is too small, we ignore the contour
-            ll, ur = np.min(c, 0), np.max(c, 0)
-            wh = ur - ll
-            if wh[0]*wh[1] < self.min_area: continue
-
-            # Finally, construct the rotatedbox. If its aspect ratio is too small, we ignore it
-            rb = RotatedBox.from_points(c, self.box_type)
-            if rb.height == 0 or rb.width/rb.height < self.min_box_aspect: continue
-
-            # All tests fine, add to the list
-            results.append(rb)
+        cs = self._contours(img_binary, self.min_area)
+        if cs:
+            # Look at the bounding boxes of all contours at once. If one is too small, we ignore the contour
+            starts = np.cumsum([0] + [len(c) for c in cs[:-1]])
+            points = np.vstack(cs)
+            wh = np.maximum.reduceat(points, starts) - np.minimum.reduceat(points, starts)
+            for i in np.flatnonzero(wh[:, 0]*wh[:, 1] >= self.min_area):
+                # Finally, construct the rotatedbox. If its aspect ratio is too small, we ignore it
+                rb = RotatedBox.from_points(cs[i], self.box_type)
+                if rb.height == 0 or rb.width/rb.height < self.min_box_aspect: continue
+
+                # All tests fine, add to the list
+                results.append(rb)
 
         # Next sort and leave only max_boxes largest boxes by area
-        results.sort(lambda x,y: 1 if x.area < y.area else -1)
+        results.sort(key=lambda b: b.area, reverse=True)
         return self._merge_boxes(results[0:self.max_boxes])
 
+    @staticmethod
+    def _contours(img_binary, min_area=0):
+        """Returns the contours of measure.find_contours(img_binary, 0.5), except (some of) the ones with a bounding box
+        smaller than min_area.
+
+        Each contour lies within the bounding box of an 8-connected component of img_binary, and different components do not
+        share any of the 2x2 cells of the marching squares. Hence we find the contours separately within the bounding boxes
+        of the components, skipping the components which are too small, rather than assembling the contours of all
+        the specks of noise on the page (of which there may be thousands) only to throw them away.
+        The contours which are found are exactly the same as the ones of find_contours (up to the order).
+        """
+        labels, n = ndimage.label(img_binary, structure=np.ones((3, 3)))
+        if n == 0:
+            return []
+        objects = ndimage.find_objects(labels)
+        bounds = np.array([[s[0].start, s[0].stop, s[1].start, s[1].stop] for s in objects])
+        large = np.flatnonzero((bounds[:, 1] - bounds[:, 0])*(bounds[:, 3] - bounds[:, 2]) >= min_area)
+        # Each window includes a margin of one pixel around the component (where the image has one), so that the contours close
+        bounds = np.maximum(bounds + [-1, 1, -1, 1], 0)
+        contours = []
+        for i in large:
+            r1, r2, c1, c2 = bounds[i]
+            for c in measure.find_contours(labels[r1:r2, c1:c2] == i + 1, 0.5):
+                contours.append(c + [r1, c1])
+        return contours
+
     def _are_aligned_angles(self, b1, b2):
         "Are two boxes aligned according to their angle?"
         return abs(b1 - b2) <= self.angle_tol or abs(np.pi - abs(b1 - b2)) <= self.angle_tol
@@ -168,44 +479,219 @@ class MRZBoxLocator(object):
 
 class FindFirstValidMRZ(object):
     """Iterates over boxes found by MRZBoxLocator, passes them to BoxToMRZ, finds the first valid MRZ
-    or the best-scoring MRZ"""
+    or the best-scoring MRZ.
+    The full resolution `img` is requested from the pipeline only when there is a box to OCR (see DraftScaler)."""
 
     __provides__ = ['box_idx', 'roi', 'text', 'mrz']
-    __depends__ = ['boxes', 'img', 'img_small', 'scale_factor', '__data__']
+    __depends__ = ['boxes', 'img_small', 'scale_factor', '__data__']
 
-    def __init__(self, use_original_image=True):
-        self.box_to_mrz = BoxToMRZ(use_original_image)
+    def __init__(self, use_original_image=True, ocr_engine=None, workers=1, ocr_memo=None):
+        """
+        :param workers: when larger than 1, up to this many boxes (and their fallback methods, see BoxToMRZ) are
+                        processed concurrently, in separate threads, with at most this many OCR calls at a time.
+                        Once a box gives a valid MRZ, the work on the subsequent boxes is cancelled.
+                        The result is the same as with sequential processing.
+        :param ocr_memo: the memo of OCR results, see BoxToMRZ.
+        """
+        self.box_to_mrz = BoxToMRZ(use_original_image, ocr_engine, workers=workers, ocr_memo=ocr_memo)
+        self.workers = workers
 
-    def __call__(self, boxes, img, img_small, scale_factor, data):
+    def __call__(self, boxes, img_small, scale_factor, data):
         mrzs = []
         data['__debug__mrz'] = []
-        for i, b in enumerate(boxes):
-            roi, text, mrz = self.box_to_mrz(b, img, img_small, scale_factor)
-            data['__debug__mrz'].append((roi, text, mrz))
-            if mrz.valid:
-                return i, roi, text, mrz
-            elif mrz.valid_score > 0:
-                mrzs.append((i, roi, text, mrz))
+        pipeline = data['__pipeline__']
+        img = pipeline['img'] if boxes and self.box_to_mrz.use_original_image else None
+        threads = _OCRThreads(self.workers) if self.workers > 1 else None
+        results = self._box_results(boxes, img, img_small, scale_factor, data.get('__deadline__'), data.get('__cancel__'),
+                                    threads)
+        try:
+            for i, result in enumerate(results):
+                if result is None:
+                    # Out of time (or cancelled), the box was not even looked at
+                    data['__truncated__'] = True
+                    continue
+                roi, text, mrz, trace = result
+                data['__debug__mrz'].append((roi, text, mrz))
+                for method in trace:
+                    if method.startswith('memo:'):
+                        pipeline.count('ocr_memo_hits')
+                    else:
+                        pipeline.count('ocr_calls')
+                        pipeline.count('ocr_calls:%s' % method)
+                if mrz.aux.get('truncated'):
+                    data['__truncated__'] = True
+                if mrz.valid:
+                    return i, roi, text, mrz
+                elif mrz.valid_score > 0:
+                    mrzs.append((i, roi, text, mrz))
+        finally:
+            results.close()
+            if threads is not None:
+                threads.close()
         if len(mrzs) == 0:
             return None, None, None, None
         else:
-            mrzs.sort(cmp = lambda x,y: x[3].valid_score - y[3].valid_score)
+            mrzs.sort(key=lambda x: x[3].valid_score)
             return mrzs[-1]
 
+    def _box_result(self, box, img, img_small, scale_factor, deadline, cancel=None, threads=None):
+        """Returns (roi, text, mrz, trace) for the box or None if there was no time left to process it."""
+        if (deadline is not None and time.time() >= deadline) or (cancel is not None and cancel.is_set()):
+            return None
+        trace = []
+        roi, text, mrz = self.box_to_mrz(box, img, img_small, scale_factor, trace, deadline, cancel, threads)
+        return roi, text, mrz, trace
+
+    def _box_results(self, boxes, img, img_small, scale_factor, deadline, cancel=None, threads=None):
+        """Yields the results of _box_result for each box, in order. In concurrent mode (i.e. when `threads`, an
+        _OCRThreads instance, is given), the processing of all subsequent boxes is cancelled as soon as one of the
+        boxes gives a valid MRZ. The processing of all boxes is cancelled once the `cancel` event (if given) is set."""
+        if threads is None or len(boxes) <= 1:
+            for b in boxes:
+                yield self._box_result(b, img, img_small, scale_factor, deadline, cancel, threads)
+            return
+
+        own_cancel = [threading.Event() for b in boxes]
+        def on_done(i, result):
+            if result is not None and result[2].valid:
+                for c in own_cancel[i+1:]:
+                    c.set()
+        try:
+            tasks = [threads.boxes.apply_async(self._box_result, (b, img, img_small, scale_factor, deadline,
+                                                                  _AnyEvent(cancel, own_cancel[i]), threads),
+                                               callback=lambda r, i=i: on_done(i, r))
+                     for i, b in enumerate(boxes)]
+            for t in tasks:
+                yield t.get()
+        finally:
+            # The tasks still queued or running return promptly once cancelled, the pool itself is closed by the caller
+            for c in own_cancel:
+                c.set()
+
+
+class _AnyEvent(object):
+    """Combines several threading.Event-s (some of which may be None) into one, which is set when any of them is."""
+
+    def __init__(self, *events):
+        self.events = [e for e in events if e is not None]
+
+    def is_set(self):
+        return any([e.is_set() for e in self.events])
+
+
+class _OCRThreads(object):
+    """The threads of a concurrent FindFirstValidMRZ (or BoxToMRZ) call: a pool for the boxes, a pool for the fallback
+    methods, shared by all the boxes, and a semaphore, which limits the number of simultaneous OCR calls (and hence of
+    tesseract processes) to `workers` over both levels. The pools are separate, as the box tasks wait for the fallback
+    tasks (in a single pool the box tasks could take all the threads and wait forever). They are started on first use."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.ocr_slots = threading.BoundedSemaphore(workers)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, name):
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = ThreadPool(self.workers)
+            return self._pools[name]
+
+    @property
+    def boxes(self):
+        return self._pool('boxes')
+
+    @property
+    def fallbacks(self):
+        return self._pool('fallbacks')
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.terminate()
+
 
 class BoxToMRZ(object):
-    """Extracts ROI from the image, corresponding to a box found by MRZBoxLocator, does OCR and MRZ parsing on this region."""
+    """Extracts ROI from the image, corresponding to a box found by MRZBoxLocator, does OCR and MRZ parsing on this region.
+
+    If the OCR of the ROI "as is" does not produce a valid MRZ, a number of fallback methods are tried, each of which
+    OCRs a preprocessed version of the ROI. The result with the best valid_score is kept.
+    The available fallback methods are:
+        - `'rescaled(3)'`, `'rescaled(1)'` - the ROI is enlarged (if it is not wide enough already) using a spline
+          interpolation of order 3 or 1 correspondingly. Sometimes the filter used for enlargement is important!
+        - `'black_tophat'` - the ROI is processed with a black tophat filter.
+        - `'black_tophat(rescaled(3))'` - the black tophat-filtered ROI is enlarged.
+
+    The OCR results are memoized by the hash of the image pixels, hence an image which has already been recognized
+    (e.g. the same ROI when the box is found again by TryOtherMaxWidth) is never sent to OCR twice.
+    """
 
     __provides__ = ['roi', 'text', 'mrz']
     __depends__ = ['box', 'img', 'img_small', 'scale_factor']
 
-    def __init__(self, use_original_image=True):
+    # Fallback methods in the order they are tried by default. This is the order of the original pipeline, which has not been
+    # re-ranked by measured payoff: rescaling goes first, the black tophat filter (which sometimes makes tesseract run for
+    # an unreasonably long time) goes last. To rank the methods on your own data, look at the 'ocr_calls:<method>'
+    # counters of passporteye-bench and the "Methods used" summary of evaluate_mrz.
+    FALLBACKS = ['rescaled(3)', 'rescaled(1)', 'black_tophat', 'black_tophat(rescaled(3))']
+
+    def __init__(self, use_original_image=True, ocr_engine=None, in_memory_ocr=True, fallbacks=None, ocr_timeout=None, workers=1,
+                 ocr_memo=None, fast_morphology=True):
         """
         :param use_original_image: when True, the ROI is extracted from img, otherwise from img_small
+        :param ocr_engine: a long-lived OCR engine (e.g. util.ocr.OCRPool) to run OCR on. When None, every OCR
+                           attempt starts a new tesseract process.
+        :param in_memory_ocr: when True (default), the ROI is piped to tesseract directly rather than via temporary files.
+                              Set to False for tesseract versions older than 3.03, which cannot read from stdin.
+        :param fallbacks: the list of fallback methods to try, in order. Defaults to BoxToMRZ.FALLBACKS.
+        :param ocr_timeout: maximum number of seconds a single OCR attempt may take. An attempt that times out
+                            is treated as if nothing was recognized. None means no limit (except the deadline, see __call__).
+        :param workers: when larger than 1, up to this many fallback methods are tried concurrently, in separate threads.
+                        Once a method gives a valid MRZ, the subsequent methods are cancelled.
+                        The result is the same as when the methods are tried one after another.
+                        The OCR engine must be thread-safe in this case (TesseractEngine and OCRPool are).
+        :param ocr_memo: a cache (see util.cache) to memoize the OCR results in. When None (default), each BoxToMRZ
+                         instance (and hence each MRZPipeline) keeps its own small memo. Pass a shared, bounded
+                         MemoryCache to memoize across all documents of the process, or False to disable memoization.
+        :param fast_morphology: when True (default), the black_tophat method uses util.morphology rather than
+                                skimage.morphology (several times faster for its disk-shaped structuring element,
+                                with exactly the same results).
         """
         self.use_original_image = use_original_image
-
-    def __call__(self, box, img, img_small, scale_factor):
+        self.ocr_engine = ocr_engine
+        self.in_memory_ocr = in_memory_ocr
+        self.fallbacks = fallbacks if fallbacks is not None else list(self.FALLBACKS)
+        self.ocr_timeout = ocr_timeout
+        self.workers = workers
+        if ocr_memo is None:
+            ocr_memo = MemoryCache(max_size=256)
+        self.ocr_memo = ocr_memo if ocr_memo is not False else None
+        self.fast_morphology = fast_morphology
+        self._disk = morphology.disk(5)  # The structuring element of the black_tophat method
+
+    def __call__(self, box, img, img_small, scale_factor, trace=None, deadline=None, cancel=None, threads=None):
+        """
+        :param trace: if a list is given, the name of the method of each OCR attempt is appended to it
+                      ('direct', 'direct(reversed)', 'rescaled(3)', ...). The methods, the results of which were
+                      found in the memo (rather than recognized anew), are prefixed with 'memo:'.
+        :param deadline: if given, the time (as in time.time()) by which the processing must complete.
+                         Once it is reached, no more fallbacks are tried, the running OCR is interrupted,
+                         and the best result so far is returned with its aux['truncated'] set to True.
+        :param cancel: if given, a threading.Event, which, once set, interrupts the processing.
+                       The result is meaningless in this case.
+        :param threads: the threads to run the fallback methods on, shared with the caller (see FindFirstValidMRZ).
+                        When None and workers > 1, the threads are started for this call.
+        """
+        own_threads = threads is None and self.workers > 1
+        if own_threads:
+            threads = _OCRThreads(self.workers)
+        try:
+            return self._box_to_mrz(box, img, img_small, scale_factor, trace, deadline, cancel, threads)
+        finally:
+            if own_threads:
+                threads.close()
+
+    def _box_to_mrz(self, box, img, img_small, scale_factor, trace, deadline, cancel, threads):
+        trace = trace if trace is not None else []
         img = img if self.use_original_image else img_small
         scale = 1.0/scale_factor if self.use_original_image else 1.0
 
@@ -218,63 +704,154 @@ class BoxToMRZ(object):
         if abs(box.angle) <= 0.01:
             box.angle = 0.0
 
+        truncated = []
         roi = box.extract_from_image(img, scale)
-        text = ocr(roi)
+        text = self._ocr(roi, 'direct', trace, deadline, truncated, cancel, threads)
 
         if '>>' in text or ('>' in text and '<' not in text):
             # Most probably we need to reverse the ROI
             roi = roi[::-1,::-1]
-            text = ocr(roi)
+            text = self._ocr(roi, 'direct(reversed)', trace, deadline, truncated, cancel, threads)
 
         if not '<' in text:
             # Assume this is unrecoverable and stop here (TODO: this may be premature, although it saves time on useless stuff)
-            return roi, text, MRZ.from_ocr(text)
+            mrz = MRZ.from_ocr(text)
+            if truncated:
+                mrz.aux['truncated'] = True
+            return roi, text, mrz
 
         mrz = MRZ.from_ocr(text)
         mrz.aux['method'] = 'direct'
 
         # Now try improving the result via hacks
-        if not mrz.valid:
-            text, mrz = self._try_larger_image(roi, text, mrz)
-
-        # Sometimes the filter used for enlargement is important!
-        if not mrz.valid:
-            text, mrz = self._try_larger_image(roi, text, mrz, 1)
-
-        if not mrz.valid:
-            text, mrz = self._try_black_tophat(roi, text, mrz)
-
-
+        results = self._fallback_results(roi, trace, deadline, truncated, cancel, threads)
+        try:
+            for method, new_text in results:
+                if mrz.valid:
+                    break
+                if new_text is None:
+                    continue
+                new_mrz = MRZ.from_ocr(new_text)
+                if new_mrz.valid_score > mrz.valid_score:
+                    new_mrz.aux['method'] = method
+                    text, mrz = new_text, new_mrz
+        finally:
+            results.close()
+
+        if truncated:
+            mrz.aux['truncated'] = True
         return roi, text, mrz
 
-    def _try_larger_image(self, roi, cur_text, cur_mrz, filter_order=3):
-        """Attempts to improve the OCR result by scaling the image. If the new mrz is better, returns it, otherwise returns
-        the old mrz."""
+    def _ocr(self, img, method, trace, deadline=None, truncated=None, cancel=None, threads=None):
+        """Runs OCR within the time limits. Returns an empty string (and notes the method in `truncated`) on timeout,
+        when there is no time left to start it, or on cancellation. With `threads`, waits for one of its OCR slots first."""
+        key = ocr_key(img) if self.ocr_memo is not None else None
+        if key is not None:
+            text = self.ocr_memo.get(key)
+            if text is not None:
+                trace.append('memo:%s' % method)
+                return text
+        if threads is None:
+            return self._ocr_now(img, method, trace, deadline, truncated, cancel, key)
+        with threads.ocr_slots:
+            # The deadline or the cancellation may have come while waiting for the slot, hence the checks in _ocr_now
+            return self._ocr_now(img, method, trace, deadline, truncated, cancel, key)
+
+    def _ocr_now(self, img, method, trace, deadline, truncated, cancel, key):
+        """Does the actual OCR for _ocr, memoizing the result under `key` (unless it is None)."""
+        if cancel is not None and cancel.is_set():
+            return ''
+        if deadline is not None and time.time() >= deadline:
+            # Do not start a tesseract process only to kill it right away
+            if truncated is not None:
+                truncated.append(method)
+            return ''
+        trace.append(method)
+        timeout = self.ocr_timeout
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0) if timeout is None else min(timeout, max(deadline - time.time(), 0))
+        try:
+            text = ocr(img, engine=self.ocr_engine, in_memory=self.in_memory_ocr, timeout=timeout, cancel=cancel)
+        except OCRTimeoutError:
+            if truncated is not None:
+                truncated.append(method)
+            return ''
+        except OCRCancelledError:
+            return ''
+        if key is not None:
+            self.ocr_memo.put(key, text)
+        return text
+
+    def _fallback_result(self, method, variants, trace, deadline, truncated, cancel, lock=None, threads=None):
+        """Returns the OCR text of the ROI preprocessed according to the given fallback method, or None if the
+        method is not applicable or there was no time left to try it."""
+        if cancel is not None and cancel.is_set():
+            return None
+        if deadline is not None and time.time() >= deadline:
+            if truncated is not None:
+                truncated.append(method)
+            return None
+        if lock is not None:
+            with lock:
+                roi_v = self._preprocess(method, variants)
+        else:
+            roi_v = self._preprocess(method, variants)
+        if roi_v is None:
+            return None
+        return self._ocr(roi_v, method, trace, deadline, truncated, cancel, threads)
+
+    def _fallback_results(self, roi, trace, deadline, truncated, cancel, threads=None):
+        """Yields (method, text) pairs for the fallback methods, in order.
+        In concurrent mode (i.e. when `threads` is given), all the methods are submitted at once, and the subsequent
+        ones are cancelled as soon as one of the methods gives a valid MRZ."""
+        variants = {'': roi}  # Preprocessed versions of the ROI, shared between the fallback methods
+        if threads is None or len(self.fallbacks) <= 1:
+            for method in self.fallbacks:
+                yield method, self._fallback_result(method, variants, trace, deadline, truncated, cancel)
+            return
+
+        own_cancel = [threading.Event() for m in self.fallbacks]
+        def on_done(i, text):
+            if text is not None and MRZ.from_ocr(text).valid:
+                for c in own_cancel[i+1:]:
+                    c.set()
+        lock = threading.Lock()
+        try:
+            tasks = [threads.fallbacks.apply_async(self._fallback_result,
+                                                   (m, variants, trace, deadline, truncated, _AnyEvent(cancel, own_cancel[i]),
+                                                    lock, threads),
+                                                   callback=lambda r, i=i: on_done(i, r))
+                     for i, m in enumerate(self.fallbacks)]
+            for m, t in zip(self.fallbacks, tasks):
+                yield m, t.get()
+        finally:
+            for c in own_cancel:
+                c.set()
+
+    def _preprocess(self, method, variants):
+        """Returns the version of the ROI (variants['']), preprocessed according to the given fallback method,
+        or None if the method is not applicable. Computed versions are memorized in the `variants` dictionary."""
+        if method not in variants:
+            if method.startswith('rescaled('):
+                variants[method] = self._larger_image(variants[''], int(method[len('rescaled('):-1]))
+            elif method == 'black_tophat':
+                mo = fast_morphology if self.fast_morphology else morphology
+                variants[method] = mo.black_tophat(variants[''], self._disk)
+            elif method.startswith('black_tophat('):
+                # The method in parentheses is applied to the black tophat-filtered ROI
+                roi_b = self._preprocess('black_tophat', variants)
+                variants[method] = self._preprocess(method[len('black_tophat('):-1], {'': roi_b})
+            else:
+                raise ValueError("Unknown fallback method: %s" % method)
+        return variants[method]
+
+    def _larger_image(self, roi, filter_order=3):
+        """Enlarges the ROI to be around 1050 pixels wide. Returns None for ROIs wider than 700 pixels."""
         if roi.shape[1] <= 700:
             scale_by = int(1050.0/roi.shape[1] + 0.5)
-            roi_lg = transform.rescale(roi, scale_by, order=filter_order)
-            new_text = ocr(roi_lg)
-            new_mrz = MRZ.from_ocr(new_text)
-            new_mrz.aux['method'] = 'rescaled(%d)' % filter_order
-            if new_mrz.valid_score > cur_mrz.valid_score:
-                cur_mrz = new_mrz
-                cur_text = new_text
-        return cur_text, cur_mrz
-
-    def _try_black_tophat(self, roi, cur_text, cur_mrz):
-        roi_b = morphology.black_tophat(roi, morphology.disk(5))
-        new_text = ocr(roi_b)  # There are some examples where this line basically hangs for an undetermined amount of time.
-        new_mrz = MRZ.from_ocr(new_text)
-        if new_mrz.valid_score > cur_mrz.valid_score:
-            new_mrz.aux['method'] = 'black_tophat'
-            cur_text, cur_mrz = new_text, new_mrz
-
-        new_text, new_mrz = self._try_larger_image(roi_b, cur_text, cur_mrz)
-        if new_mrz.valid_score > cur_mrz.valid_score:
-            new_mrz.aux['method'] = 'black_tophat(rescaled(3))'
-            cur_text, cur_mrz = new_text, new_mrz
-
-        return cur_text, cur_mrz
+            return transform.rescale(roi, scale_by, order=filter_order)
+        else:
+            return None
 
 
 class TryOtherMaxWidth(object):
@@ -291,42 +868,343 @@ class TryOtherMaxWidth(object):
 
     def __call__(self, mrz, __pipeline__):
         # We'll only try this if we see that img_binary.mean() is very small or img.mean() is very large (i.e. image is mostly white).
-        if mrz is None and (__pipeline__['img_binary'].mean() < 0.01 or __pipeline__['img'].mean() > 0.95):
-            __pipeline__.replace_component('scaler', Scaler(self.other_max_width))
+        # (The mean of img_small is as good as that of img and does not require the full image, see DraftScaler)
+        if mrz is None and (__pipeline__['img_binary'].mean() < 0.01 or __pipeline__['img_small'].mean() > 0.95):
+            deadline, cancel = __pipeline__.data.get('__deadline__'), __pipeline__.data.get('__cancel__')
+            if (deadline is not None and time.time() >= deadline) or (cancel is not None and cancel.is_set()):
+                __pipeline__['__truncated__'] = True
+                return mrz
+            scaler = copy.copy(__pipeline__.components['scaler'])  # Keep the kind of the scaler (e.g. DraftScaler)
+            scaler.max_width = self.other_max_width
+            __pipeline__.replace_component('scaler', scaler)
             new_mrz = __pipeline__['mrz']
-            new_mrz.aux['method'] = new_mrz.aux['method'] + '|max_width(%d)' % self.other_max_width
+            if new_mrz is not None:
+                new_mrz.aux['method'] = new_mrz.aux.get('method', 'direct') + '|max_width(%d)' % self.other_max_width
             mrz = new_mrz
         return mrz
 
 
 class MRZPipeline(Pipeline):
-    """This is the "currently best-performing" pipeline for parsing MRZ from a given image file."""
+    """This is the "currently best-performing" pipeline for parsing MRZ from a given image file.
 
-    def __init__(self, filename):
+    To process many files, set up the pipeline once, without a filename, and use it as a template for the runs
+    on the individual files. This saves setting up the components (and their precomputed data) for each file:
+
+        template = MRZPipeline(None, ocr_engine=engine)
+        for fn in filenames:
+            mrz = template.run(fn).result
+    """
+
+    # In principle we might have different pipelines in use, so possible backward compatibility is an issue.
+    # The version is also a part of the read_mrz cache keys, hence it must be changed whenever the results may change.
+    version = '1.0'
+
+    def __init__(self, filename, ocr_engine=None, hooks=(), deadline=None, ocr_workers=1, ocr_memo=None, cancel=None,
+                 jpeg_draft=False, dtype=None, mmap=False):
+        """
+        :param filename: the image or PDF file (a filename, bytes, a binary stream or an image ndarray, see Loader).
+                         None sets up a template pipeline, see `run`.
+        :param deadline: if given, the number of seconds (counted from now) the pipeline may take to produce a result.
+                         See read_mrz.
+        :param ocr_workers: the number of threads for concurrent OCR of candidate boxes and fallback methods.
+                            See FindFirstValidMRZ.
+        :param ocr_memo: the memo of OCR results, see BoxToMRZ. By default, each pipeline keeps its own.
+        :param cancel: a threading.Event, which, once set, stops the OCR of the candidate boxes. See read_mrz.
+        :param jpeg_draft: when True, JPEG images are decoded at a reduced resolution for the MRZ detection,
+                           and in full only if needed for OCR. See DraftScaler.
+        :param dtype: the pixel type of the loaded image: None (default), np.uint8 or np.float32. See Loader.
+        :param mmap: when True, the loaded image is memory-mapped rather than held in memory. See Loader.
+        """
         super(MRZPipeline, self).__init__()
-        self.version = '1.0'  # In principle we might have different pipelines in use, so possible backward compatibility is an issue
         self.filename = filename
-        self.add_component('loader', Loader(filename))
-        self.add_component('scaler', Scaler())
+        self.add_component('loader', Loader(filename, dtype=dtype, mmap=mmap))
+        self.add_component('scaler', DraftScaler() if jpeg_draft else Scaler())
         self.add_component('boone', BooneTransform())
         self.add_component('box_locator', MRZBoxLocator())
-        self.add_component('mrz', FindFirstValidMRZ())
+        self.add_component('mrz', FindFirstValidMRZ(ocr_engine=ocr_engine, workers=ocr_workers, ocr_memo=ocr_memo))
         self.add_component('other_max_width', TryOtherMaxWidth())
+        self.data['__deadline__'] = time.time() + deadline if deadline is not None else None
+        self.data['__cancel__'] = cancel
+        for hook in hooks:
+            self.add_hook(hook)
+
+    def run(self, filename, deadline=None, cancel=None, hooks=()):
+        """Returns a run of this pipeline on the given file (see Pipeline.bind). Nothing is computed until requested
+        (e.g. via the `result` property). The runs share the components of the template, including the OCR engine
+        and the OCR memo (see BoxToMRZ), hence a template should not be shared between threads unless the OCR engine is
+        thread-safe (e.g. an OCRPool).
+
+        :param deadline: the number of seconds (counted from now) the run may take to produce a result, see read_mrz.
+        :param cancel: a threading.Event, which, once set, stops the OCR of the candidate boxes. See read_mrz.
+        :param hooks: callables to be notified after each component run, in addition to the hooks of the template.
+        """
+        run = self.bind(filename=filename, __deadline__=time.time() + deadline if deadline is not None else None,
+                        __cancel__=cancel)
+        run.filename = filename
+        for hook in hooks:
+            run.add_hook(hook)
+        return run
 
     @property
     def result(self):
         return self['mrz_final']
 
 
-def read_mrz(filename, save_roi=False):
+def read_mrz(filename, save_roi=False, ocr_engine=None, hooks=(), deadline=None, ocr_workers=1, cache=None, ocr_memo=None,
+             cancel=None, jpeg_draft=False, dtype=None, mmap=False):
     """The main interface function to this module, encapsulating the recognition pipeline.
        Given an image filename, runs MRZPipeline on it, returning the parsed MRZ object.
 
+    :param filename: the image (or PDF) filename. The contents of the file (bytes), a binary stream (file-like object)
+                     or a numpy ndarray with the image are accepted as well, see Loader.
+                     The images of a PDF document are tried page by page until a valid MRZ is found (see _read_mrz_pdf).
+
     :param save_roi: when this is True, the .aux['roi'] field will contain the Region of Interest where the MRZ was parsed from.
+    :param ocr_engine: a long-lived OCR engine (e.g. util.ocr.OCRPool), which may be reused across many read_mrz calls.
+                       When None, every OCR attempt starts a new tesseract process.
+    :param hooks: callables to be notified after each pipeline component run, see Pipeline.add_hook.
+    :param deadline: if given, the maximum number of seconds the recognition may take. Once the time is out, no more
+                     OCR fallback methods or candidate boxes are tried, the running OCR is interrupted, and the best
+                     MRZ found so far is returned, with .aux['truncated'] set to True.
+                     Note that the time spent on loading and preprocessing the image is not interrupted.
+    :param ocr_workers: when larger than 1, the candidate regions and the OCR fallback methods for each of them are
+                        processed concurrently by this many threads. The remaining work is cancelled as soon as
+                        a valid MRZ is found. The result is the same as with the default sequential processing.
+
+    The returned MRZ's .aux['stats'] field contains the per-component timings and the OCR counters of the pipeline
+    (see Pipeline.stats): 'ocr_calls' is the total number of OCR invocations, 'ocr_calls:<method>' - the number of
+    invocations of each particular method ('direct', 'rescaled(3)', 'black_tophat', ...), 'ocr_memo_hits' - the number
+    of OCR results reused from the memo.
+
+    :param cache: a cache (e.g. util.cache.MemoryCache or util.cache.DiskCache) for the results. The results are keyed
+                  by the contents of the file (rather than its name), the version of the pipeline and the parameters
+                  which affect the result, so a repeatedly submitted document is only processed once.
+                  Results truncated due to the deadline are not cached.
+                  Cache hits return a shallow copy of the cached MRZ object (with its own .aux dictionary).
+    :param ocr_memo: within a single document the same image is never OCR-ed twice. To extend this to all documents
+                     processed by the process, pass a (bounded) util.cache.MemoryCache here. See BoxToMRZ.
+    :param cancel: a threading.Event, which may be set from another thread to abandon the recognition: no more
+                   OCR is started, the running tesseract processes are killed, and the best MRZ found so far
+                   (or None) is returned, marked as truncated. Note that the image preprocessing is not interrupted.
+                   See also read_mrz_async.
+    :param jpeg_draft: when True, large JPEG images are decoded at a reduced resolution to look for the MRZ
+                       and in full only once a candidate MRZ region is found, which is several times faster for
+                       photos of many megapixels. The results may differ slightly. See DraftScaler.
+                       This does not apply to the images of PDF documents.
+    :param dtype: np.uint8 or np.float32 to keep the image in 8-bit or single precision grey levels rather than the default
+                  float64, which takes 8 or 2 times less memory for large images. The results may differ slightly.
+                  See Loader.
+    :param mmap: when True, the image is memory-mapped (in 8-bit grey levels, unless `dtype` says otherwise) rather than
+                 loaded into memory: the MRZ is looked for on a scaled down version of it, and only the part of the image
+                 under the candidate regions is read at full resolution. This keeps the memory use of large scans
+                 (e.g. 600 dpi pages) bounded. Uncompressed images (such as raw TIFFs) are mapped directly from the file.
+                 See Loader.
     """
-    p = MRZPipeline(filename)
-    mrz = p.result
+    if cache is not None:
+        if hasattr(filename, 'read'):
+            filename = filename.read()  # The stream is hashed and then decoded, hence we need to read it just once
+        params = {'save_roi': save_roi}
+        # (The non-default modes only, so that the keys of the existing caches stay valid)
+        if jpeg_draft:
+            params['jpeg_draft'] = True
+        if dtype is not None:
+            params['dtype'] = np.dtype(dtype).name
+        if mmap:
+            params['mmap'] = True
+        key = _cache_key(filename, **params)
+        mrz = cache.get(key, _NOT_CACHED)
+        if mrz is not _NOT_CACHED:
+            return _copy_mrz(mrz)
+
+    pdf = None
+    if not isinstance(filename, np.ndarray):
+        filename, pdf = _open_pdf(BytesIO(bytes(filename)) if _is_data(filename) else filename)
+    if pdf is not None:
+        try:
+            mrz, truncated = _read_mrz_pdf(pdf, save_roi, ocr_engine, hooks, deadline, ocr_workers, ocr_memo, cancel, dtype,
+                                           mmap)
+        finally:
+            if pdf is not filename:
+                pdf.close()
+    else:
+        p = MRZPipeline(filename, ocr_engine, hooks, deadline, ocr_workers, ocr_memo, cancel, jpeg_draft, dtype, mmap)
+        mrz, truncated = p.result, p.data.get('__truncated__', False) or (cancel is not None and cancel.is_set())
+        if mrz is not None:
+            if save_roi: mrz.aux['roi'] = p['roi']
+            mrz.aux['stats'] = p.stats
+            mrz.aux['truncated'] = truncated
+
+    if cache is not None and not truncated:
+        cache.put(key, _copy_mrz(mrz))
+    return mrz
+
 
+def _read_mrz_pdf(pdf, save_roi, ocr_engine, hooks, deadline, ocr_workers, ocr_memo, cancel=None, dtype=None, mmap=False):
+    """Runs the MRZ pipeline on the images of a PDF document (see util.pdf.iter_pdf_images), page by page,
+    until a valid MRZ is found. The document is only parsed as far as needed.
+    Returns (mrz, truncated): the first valid MRZ or, if there is none, the one with the best valid_score,
+    with its .aux['page'] set to the number of the page where it was found (starting from 0), and whether
+    the search was cut short by the deadline (or cancelled). The .aux['stats'] of the result describe the run on its page only."""
+    from ..util.pdf import iter_pdf_images
+    end_time = time.time() + deadline if deadline is not None else None
+    best, truncated = None, False
+    for image in iter_pdf_images(pdf):
+        if (end_time is not None and time.time() >= end_time) or (cancel is not None and cancel.is_set()):
+            truncated = True
+            break
+        img = _load_pdf_image(image, dtype=dtype, mmap=mmap)
+        if img is None:
+            continue
+        mrz = read_mrz(img, save_roi, ocr_engine, hooks, None if end_time is None else max(end_time - time.time(), 0),
+                       ocr_workers, ocr_memo=ocr_memo, cancel=cancel)
+        if mrz is None:
+            continue
+        mrz.aux['page'] = image.page
+        truncated = truncated or mrz.aux['truncated']
+        if best is None or mrz.valid_score > best.valid_score:
+            best = mrz
+        if mrz.valid:
+            return mrz, False
+    if best is not None:
+        best.aux['truncated'] = truncated
+    return best, truncated
+
+
+def _copy_mrz(mrz):
+    """A shallow copy of the MRZ object along with its .aux dictionary, so that the cached objects are not modified by callers."""
     if mrz is not None:
-        if save_roi: mrz.aux['roi'] = p['roi']
+        mrz = copy.copy(mrz)
+        mrz.aux = dict(mrz.aux)
     return mrz
+
+
+# Marks a cache miss in read_mrz (None is a valid cached result, meaning that no MRZ was found)
+_NOT_CACHED = object()
+
+
+def _cache_key(filename, **params):
+    """Computes the read_mrz cache key for the given file (or data, or image array) and parameters:
+    a hash of the file contents, followed by the pipeline version and the parameter values."""
+    h = hashlib.sha1()
+    if isinstance(filename, np.ndarray):
+        h.update(('%s:%s:' % (filename.dtype.str, filename.shape)).encode('ascii'))
+        h.update(np.ascontiguousarray(filename).tobytes())
+    elif _is_data(filename):
+        h.update(bytes(filename))
+    else:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return '%s:%s:%s' % (h.hexdigest(), MRZPipeline.version, ','.join(['%s=%r' % kv for kv in sorted(params.items())]))
+
+
+MRZBatchResult = namedtuple('MRZBatchResult', ['index', 'source', 'mrz', 'walltime', 'error'])
+
+# Per-worker (thread or process) state, kept by read_mrz_batch workers between items.
+_batch_worker = threading.local()
+
+
+def _read_mrz_batch_item(args):
+    """Runs read_mrz on a single item of read_mrz_batch. Returns (mrz, walltime, error)."""
+    source, kwargs = args
+    tic = time.time()
+    try:
+        if kwargs.get('ocr_engine') is None:
+            if getattr(_batch_worker, 'ocr_engine', None) is None:
+                _batch_worker.ocr_engine = TesseractEngine()
+            kwargs = dict(kwargs, ocr_engine=_batch_worker.ocr_engine)
+        mrz, error = read_mrz(source, **kwargs), None
+    except Exception:
+        mrz, error = None, traceback.format_exc()
+    return mrz, time.time() - tic, error
+
+
+def _batch_item_error(obj):
+    """Returns the formatted error if the read_mrz_batch item (or its part) can not be passed to a worker process (e.g. an
+    open file or an OCRPool can not be pickled), None otherwise. Only needed in Python 2, where the process pool loses
+    such items, so that they would never complete (in Python 3 they are reported to the error_callback).
+    File contents, arrays and filenames always can be passed, hence only other objects are actually pickled."""
+    if isinstance(obj, (bytes, bytearray, np.ndarray, type(u''))):
+        return None
+    try:
+        pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def read_mrz_batch(sources, workers=None, executor='process', ordered=True, max_in_flight=None, **kwargs):
+    """Runs read_mrz on each of the given sources in parallel, yielding the results as they become available.
+
+    Each worker keeps its OCR engine (a TesseractEngine, unless `ocr_engine` is given) across all the items it processes.
+    Errors do not interrupt the batch: they are reported in the `error` field of the corresponding result instead.
+
+    :param sources: an iterable of inputs to read_mrz (e.g. filenames). It is consumed lazily.
+    :param workers: number of parallel workers. Defaults to the number of CPUs.
+    :param executor: `'process'` (default) runs the workers in a multiprocessing.Pool, `'thread'` - in a thread pool.
+    :param ordered: when True (default), the results are yielded in the order of sources, otherwise in order of completion.
+    :param max_in_flight: maximum number of items submitted to the workers but not yet yielded. Defaults to 2*workers.
+    :param kwargs: passed to read_mrz. Note that an `ocr_engine` must be thread-safe (e.g. an OCRPool)
+                   and can only be given with the `'thread'` executor. Similarly, a `cache` is only shared by the workers
+                   if it is a MemoryCache with the `'thread'` executor, or a DiskCache.
+    :return: a generator of MRZBatchResult(index, source, mrz, walltime, error) tuples, where index is the position of
+             the item in sources, walltime is the processing time in seconds and error is either None or the
+             formatted traceback of the exception raised while processing the item.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    max_in_flight = max_in_flight or 2*workers
+    if executor == 'process':
+        pool = multiprocessing.Pool(workers)
+    elif executor == 'thread':
+        pool = ThreadPool(workers)
+    else:
+        raise ValueError("Unknown parameter value: executor=%s" % executor)
+
+    completed = queue.Queue()
+    waiting = {}  # Completed results that are waiting for their turn to be yielded (ordered mode)
+    in_flight, next_idx = 0, 0
+    check_items = executor == 'process' and sys.version_info < (3,)
+    kwargs_error = _batch_item_error(kwargs) if check_items else None
+    sources = enumerate(sources)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and in_flight < max_in_flight:
+                try:
+                    idx, source = next(sources)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight += 1
+                error = (kwargs_error or _batch_item_error(source)) if check_items else None
+                if error is not None:
+                    completed.put(MRZBatchResult(idx, source, None, 0.0, error))
+                    continue
+                callback = lambda r, idx=idx, source=source: completed.put(MRZBatchResult(idx, source, *r))
+                params = {}
+                if sys.version_info >= (3,):
+                    # Failures of the pool itself (rather than of read_mrz, which are caught by _read_mrz_batch_item)
+                    params['error_callback'] = lambda e, idx=idx, source=source: completed.put(
+                        MRZBatchResult(idx, source, None, 0.0, ''.join(traceback.format_exception_only(type(e), e))))
+                pool.apply_async(_read_mrz_batch_item, ((source, kwargs),), callback=callback, **params)
+            if in_flight == 0:
+                break
+            result = completed.get()
+            if not ordered:
+                in_flight -= 1
+                yield result
+            else:
+                waiting[result.index] = result
+                while next_idx in waiting:
+                    in_flight -= 1
+                    next_idx += 1
+                    yield waiting.pop(next_idx - 1)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+if sys.version_info >= (3, 5):
+    # The asyncio interface relies on the async/await syntax, hence it lives in a separate module
+    from .aio import read_mrz_async, ocr_async
@@ -5,16 +5,22 @@ Command-line scripts
 Author: Konstantin Tretyakov
 License: MIT
 '''
-import argparse, time, glob, pkg_resources, os, multiprocessing, logging, json, shutil
-from collections import Counter
-from skimage import io
+import argparse, time, glob, pkg_resources, os, logging, json, shutil, sys, platform, threading
+from collections import Counter, OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows
 import passporteye
-from .image import read_mrz
+# NB: The image processing modules are imported within the functions, so that e.g. `mrz --help` does not have to load them.
 
 def process_file(params):
     """
     Processes a file and returns the parsed MRZ (or None if no candidate regions were even found).
     """
+    from .image import read_mrz
     tic = time.time()
     filename, save_roi = params
     try:
@@ -40,6 +46,8 @@ def evaluate_mrz():
                                 help='Extract ROIs to this directory')
     parser.add_argument('-l', '--limit', default=-1, type=int, help='Only process the first <limit> files in the directory.')
     args = parser.parse_args()
+    from skimage import io
+    from .image import read_mrz_batch
     files = sorted(glob.glob(os.path.join(args.data_dir, '*.*')))
     if args.limit >= 0:
         files = files[0:args.limit]
@@ -48,7 +56,6 @@ def evaluate_mrz():
     log = logging.getLogger("evaluate_mrz")
 
     tic = time.time()
-    pool = multiprocessing.Pool(args.jobs)
     log.info("Preparing computation for %d files from %s" % (len(files), args.data_dir))
     log.info("Running %d workers" % args.jobs)
     results = []
@@ -71,9 +78,11 @@ def evaluate_mrz():
 
     method_stats = Counter()
 
-    for result in pool.imap_unordered(process_file, [(f, save_roi) for f in files]):
-        filename, mrz, walltime = result
-        results.append(result)
+    for batch_result in read_mrz_batch(files, workers=args.jobs, ordered=False, save_roi=save_roi):
+        filename, mrz, walltime = batch_result.source, batch_result.mrz, batch_result.walltime
+        if batch_result.error is not None:
+            log.warning("Failed to process %s:\n%s" % (os.path.basename(filename), batch_result.error))
+        results.append((filename, mrz, walltime))
         log.info("Processed %s in %0.2fs (score %d) [%s]" % (os.path.basename(filename), walltime, valid_score(mrz), score_change_type(filename, mrz)))
         log.debug("\t%s" % str(mrz))
 
@@ -130,10 +139,372 @@ def mrz():
     d['filename'] = filename
 
     if args.save_roi is not None and mrz is not None and 'roi' in mrz.aux:
+        from skimage import io
         io.imsave(args.save_roi, mrz.aux['roi'])
 
     if not args.json:
         for k in d:
             print("%s\t%s" % (k, str(d[k])))
     else:
-        print(json.dumps(d, indent=2))
\ No newline at end of file
+        print(json.dumps(d, indent=2))
+
+
+# Per-worker state of bench_mrz (the OCR engine), see _bench_item
+_bench_worker = threading.local()
+
+
+def _bench_item(params):
+    """
+    Processes a file for bench_mrz. Returns a dictionary with the MRZ valid_score, the walltime, the total walltime
+    of each pipeline component and the pipeline counters (OCR calls).
+    """
+    from .image import read_mrz
+    from ..util.ocr import TesseractEngine
+    filename, kwargs = params
+    if getattr(_bench_worker, 'ocr_engine', None) is None:
+        _bench_worker.ocr_engine = TesseractEngine()
+    pipelines = []
+    def hook(p, name, walltime, cputime):
+        if not any([p is q for q in pipelines]):
+            pipelines.append(p)
+    tic = time.time()
+    try:
+        mrz, error = read_mrz(filename, ocr_engine=_bench_worker.ocr_engine, hooks=[hook], **kwargs), None
+    except Exception as e:
+        mrz, error = None, '%s: %s' % (type(e).__name__, e)
+    result = {'filename': filename, 'walltime': time.time() - tic, 'score': mrz.valid_score if mrz is not None else 0,
+              'method': mrz.aux.get('method') if mrz is not None else None, 'error': error,
+              'stages': Counter(), 'counters': Counter()}
+    for p in pipelines:
+        for name, st in p.stats['components'].items():
+            result['stages'][name] += st['walltime']
+        result['counters'].update(p.stats['counters'])
+    return result
+
+
+def _percentiles(values):
+    import numpy as np
+    if len(values) == 0:
+        return {}
+    return OrderedDict([('mean', float(np.mean(values)))] +
+                       [('p%d' % q, float(np.percentile(values, q))) for q in [50, 90, 99]] +
+                       [('max', float(np.max(values)))])
+
+
+def _expected_score(filename):
+    """The expected valid_score of a test file is given by the prefix of its name (e.g. 100_pass-chn.jpg)."""
+    try:
+        return int(os.path.basename(filename).split('_')[0])
+    except ValueError:
+        return None
+
+
+def run_bench(files, workers=(1,), executor='process', repeat=1, **kwargs):
+    """
+    Runs read_mrz on the given files with each of the given numbers of workers, measuring the throughput,
+    the latency of the whole recognition and of each pipeline stage, the number of OCR calls, the memory use
+    and the accuracy (wrt the expected scores given by the file name prefixes, see evaluate_mrz).
+    The latencies and the accuracy are measured on the run with the smallest number of workers.
+    Returns the results as a JSON-serializable dictionary. See bench_mrz.
+
+    :param executor: 'process' or 'thread'
+    :param repeat: process the whole list of files this many times in each run.
+    :param kwargs: the parameters to read_mrz (e.g. deadline)
+    """
+    from .image import MRZPipeline
+    results = OrderedDict([('passporteye', passporteye.__version__), ('pipeline', MRZPipeline.version),
+                           ('python', platform.python_version()), ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                           ('files', len(files)), ('repeat', repeat), ('executor', executor), ('params', kwargs),
+                           ('runs', OrderedDict())])
+    items = None
+    for n in sorted(workers):
+        pool = (Pool if executor == 'process' else ThreadPool)(n)
+        try:
+            tic = time.time()
+            run_items = list(pool.imap_unordered(_bench_item, [(fn, kwargs) for fn in files]*repeat))
+            walltime = time.time() - tic
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+        results['runs'][str(n)] = OrderedDict([('workers', n), ('walltime', walltime),
+                                              ('docs_per_sec', len(run_items)/walltime if walltime > 0 else None)])
+        if items is None:
+            items = run_items
+    items = items or []
+
+    stages = sorted(set([name for it in items for name in it['stages']]))
+    results['latency'] = OrderedDict([('total', _percentiles([it['walltime'] for it in items])),
+                                      ('stages', OrderedDict([(name, _percentiles([it['stages'].get(name, 0.0) for it in items]))
+                                                              for name in stages]))])
+    num = max(len(items), 1)
+    results['ocr_calls_per_doc'] = sum([it['counters']['ocr_calls'] for it in items])/float(num)
+    results['ocr_memo_hits_per_doc'] = sum([it['counters']['ocr_memo_hits'] for it in items])/float(num)
+    scores = [it['score'] for it in items]
+    expected = [(it['score'], _expected_score(it['filename'])) for it in items if _expected_score(it['filename']) is not None]
+    results['accuracy'] = OrderedDict([('mean_score', sum(scores)/float(num)), ('perfect', scores.count(100)),
+                                       ('invalid', scores.count(0)), ('improved', len([1 for new, old in expected if new > old])),
+                                       ('worsened', len([1 for new, old in expected if new < old]))])
+    results['errors'] = len([it for it in items if it['error'] is not None])
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux (and in bytes on Mac OS)
+        unit = 1024.0*1024 if sys.platform == 'darwin' else 1024.0
+        results['peak_rss_mb'] = OrderedDict([('self', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/unit),
+                                              ('children', resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/unit)])
+    return results
+
+
+# The metrics compared by compare_bench: (path in the results, +1 if larger values are better and -1 otherwise,
+# whether the relative tolerance applies (otherwise any change for the worse is a regression))
+BENCH_METRICS = [('accuracy.mean_score', 1, False), ('accuracy.perfect', 1, False), ('errors', -1, False),
+                 ('ocr_calls_per_doc', -1, True), ('latency.total.p50', -1, True), ('latency.total.p90', -1, True),
+                 ('peak_rss_mb.self', -1, True)]
+
+
+def compare_bench(results, baseline, tolerance=0.1):
+    """
+    Compares the results of run_bench to a baseline. Returns a list of (metric, baseline value, new value) for
+    the metrics which got worse. Accuracy may not get worse at all, performance metrics (including docs_per_sec of each
+    run with the same number of workers) - by no more than the given fraction.
+
+    >>> base = {'accuracy': {'mean_score': 80.0}, 'ocr_calls_per_doc': 5.0, 'runs': {'1': {'docs_per_sec': 2.0}}}
+    >>> compare_bench({'accuracy': {'mean_score': 80.0}, 'ocr_calls_per_doc': 5.4, 'runs': {'1': {'docs_per_sec': 1.9}}}, base)
+    []
+    >>> compare_bench({'accuracy': {'mean_score': 79.0}, 'ocr_calls_per_doc': 6.0, 'runs': {'1': {'docs_per_sec': 1.0}}}, base)
+    [('accuracy.mean_score', 80.0, 79.0), ('ocr_calls_per_doc', 5.0, 6.0), ('runs.1.docs_per_sec', 2.0, 1.0)]
+    """
+    def get(d, path):
+        for k in path.split('.'):
+            if not isinstance(d, dict) or k not in d:
+                return None
+            d = d[k]
+        return d
+    metrics = BENCH_METRICS + [('runs.%s.docs_per_sec' % n, 1, True) for n in sorted(results.get('runs', {}))]
+    regressions = []
+    for path, direction, relative in metrics:
+        old, new = get(baseline, path), get(results, path)
+        if old is None or new is None:
+            continue
+        allowed = abs(old)*tolerance if relative else 0
+        if direction*(old - new) > allowed:
+            regressions.append((path, old, new))
+    return regressions
+
+
+def bench_mrz():
+    """
+    A script for benchmarking the MRZ recognition pipeline (throughput, latency, OCR calls, memory and accuracy)
+    on a directory of test files, saving the results as JSON and comparing them to a baseline.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the MRZ recognition on the sample test data (or other files), '
+                                                 'optionally comparing the results to a baseline.')
+    parser.add_argument('-dd', '--data-dir', default=pkg_resources.resource_filename('passporteye.mrz', 'testdata'),
+                        help='Read files from this directory instead of the package test files. The expected scores are '
+                             'taken from the file name prefixes, as in evaluate_mrz')
+    parser.add_argument('-l', '--limit', default=-1, type=int, help='Only process the first <limit> files in the directory.')
+    parser.add_argument('-j', '--workers', default='1', help='Comma-separated numbers of parallel workers to measure the '
+                                                             'throughput with, e.g. 1,2,4 (default: 1)')
+    parser.add_argument('--threads', action='store_true', help='Use worker threads rather than processes')
+    parser.add_argument('-r', '--repeat', default=1, type=int, help='Process the files this many times in each run')
+    parser.add_argument('--deadline', default=None, type=float, help='The deadline parameter for read_mrz')
+    parser.add_argument('-o', '--output', default=None, help='Save the results as JSON to this file')
+    parser.add_argument('-b', '--baseline', default=None, help='Compare the results to the ones saved in this file')
+    parser.add_argument('-t', '--tolerance', default=0.1, type=float,
+                        help='Allowed relative worsening of the performance metrics wrt the baseline (default: 0.1)')
+    args = parser.parse_args()
+    files = sorted(glob.glob(os.path.join(args.data_dir, '*.*')))
+    if args.limit >= 0:
+        files = files[0:args.limit]
+    kwargs = {} if args.deadline is None else {'deadline': args.deadline}
+
+    results = run_bench(files, [int(n) for n in args.workers.split(',')], 'thread' if args.threads else 'process',
+                        args.repeat, **kwargs)
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare_bench(results, json.load(f), args.tolerance)
+        for path, old, new in regressions:
+            sys.stderr.write("Regression in %s: %s -> %s\n" % (path, old, new))
+        if regressions:
+            sys.exit(1)
+        sys.stderr.write("No regressions wrt %s\n" % args.baseline)
+
+
+# The files mrz-batch picks from directories
+BATCH_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.gif', '.pgm', '.ppm', '.pdf']
+
+
+def iter_batch_inputs(paths, lists=(), extensions=BATCH_EXTENSIONS):
+    """
+    Lazily yields the files to be processed by mrz-batch: the given files as they are, the files with the given
+    extensions found in the given directories (recursively, in sorted order), followed by the files listed in the given
+    list files (one per line). The list file '-' is the standard input, which is read as the names arrive,
+    so that mrz-batch may be fed by another process.
+    """
+    extensions = set([e.lower() for e in extensions])
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fn in sorted(filenames):
+                if os.path.splitext(fn)[1].lower() in extensions:
+                    yield os.path.join(dirpath, fn)
+    for list_file in lists:
+        f = sys.stdin if list_file == '-' else open(list_file)
+        try:
+            for line in iter(f.readline, ''):
+                line = line.rstrip('\r\n')
+                if line:
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def run_mrz_batch(sources, output, checkpoint=None, log_every=0, **kwargs):
+    """
+    Runs read_mrz_batch on the sources (in the order of completion), writing the result for each of them to the output
+    stream as a line of JSON (the fields of the mrz --json output, plus 'error' with the error message, if any) as soon as
+    it is available. Nothing is kept in memory but the names of the completed sources when resuming from a checkpoint.
+
+    :param checkpoint: the name of a file to which each source is appended once its result has been written (and flushed).
+                       The sources already listed in it are skipped, hence an interrupted run is resumed by running it
+                       again with the same checkpoint (and output, opened for appending). The results of the sources
+                       which were completed at the moment of an interruption may be written twice, but never lost.
+    :param log_every: log the progress every so many results (0 means never).
+    :param kwargs: passed to read_mrz_batch (workers, executor, max_in_flight) and read_mrz.
+    :return: a Counter of the 'processed', 'valid', 'errors' and 'skipped' sources.
+    """
+    from .image import read_mrz_batch
+    log = logging.getLogger("mrz-batch")
+    stats = Counter()
+    done = set()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            done = set([line.rstrip('\r\n') for line in f])
+
+    def pending():
+        for source in sources:
+            if source in done:
+                stats['skipped'] += 1
+            else:
+                yield source
+
+    tic = time.time()
+    checkpoint_file = open(checkpoint, 'a') if checkpoint is not None else None
+    try:
+        for result in read_mrz_batch(pending(), ordered=False, **kwargs):
+            mrz = result.mrz
+            d = mrz.to_dict() if mrz is not None else OrderedDict([('mrz_type', None), ('valid', False), ('valid_score', 0)])
+            d['walltime'] = result.walltime
+            d['filename'] = result.source
+            if result.error is not None:
+                d['error'] = result.error.strip().splitlines()[-1]  # The exception, without the traceback
+            output.write(json.dumps(d) + '\n')
+            output.flush()
+            if checkpoint_file is not None:
+                checkpoint_file.write(result.source + '\n')
+                checkpoint_file.flush()
+            stats['processed'] += 1
+            if mrz is not None and mrz.valid:
+                stats['valid'] += 1
+            if result.error is not None:
+                stats['errors'] += 1
+            if log_every and stats['processed'] % log_every == 0:
+                log.info("Processed %d files (%d valid, %d errors), %0.1f files/s" %
+                         (stats['processed'], stats['valid'], stats['errors'], stats['processed']/(time.time() - tic)))
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+    return stats
+
+
+def mrz_batch():
+    """
+    A script for production batch jobs: runs the MRZ recognition on a stream of files (directory trees, file lists or the
+    standard input) using a pool of workers, writing the results as they come as newline-delimited JSON.
+    """
+    parser = argparse.ArgumentParser(description='Run the MRZ OCR recognition algorithm on many files, writing a JSON line '
+                                                 'with the result for each of them. Reads the list of files from the '
+                                                 'standard input if no inputs are given.')
+    parser.add_argument('inputs', nargs='*', help='Files to process and directories to process the image and PDF files of '
+                                                  '(recursively)')
+    parser.add_argument('-f', '--files-from', action='append', default=[],
+                        help='Process the files listed (one per line) in this file, - for the standard input')
+    parser.add_argument('-o', '--output', default='-', help='Write the results to this file (default: standard output)')
+    parser.add_argument('-c', '--checkpoint', default=None,
+                        help='Record the completed files in this file and skip the ones recorded there already, '
+                             'so that an interrupted run can be resumed. The output file is appended to in this case')
+    parser.add_argument('-j', '--workers', default=None, type=int, help='Number of parallel workers (default: number of CPUs)')
+    parser.add_argument('--threads', action='store_true', help='Use worker threads rather than processes')
+    parser.add_argument('--max-in-flight', default=None, type=int,
+                        help='Maximum number of files submitted to the workers at a time (default: twice the number '
+                             'of workers)')
+    parser.add_argument('--deadline', default=None, type=float, help='Maximum number of seconds to spend on a file')
+    parser.add_argument('--jpeg-draft', action='store_true', help='Look for the MRZ on JPEGs decoded at a reduced resolution')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map the images rather than load them (for large scans)')
+    parser.add_argument('--log-every', default=1000, type=int, help='Log the progress every so many files (default: 1000)')
+    parser.add_argument('--version', action='version', version='PassportEye MRZ v%s' % passporteye.__version__)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger("mrz-batch")
+    lists = args.files_from if args.inputs or args.files_from else ['-']
+    kwargs = dict(workers=args.workers, executor='thread' if args.threads else 'process', max_in_flight=args.max_in_flight)
+    for name in ['deadline', 'jpeg_draft', 'mmap']:
+        if getattr(args, name):
+            kwargs[name] = getattr(args, name)
+
+    tic = time.time()
+    output = sys.stdout if args.output == '-' else open(args.output, 'a' if args.checkpoint is not None else 'w')
+    try:
+        stats = run_mrz_batch(iter_batch_inputs(args.inputs, lists), output, args.checkpoint, args.log_every, **kwargs)
+    except KeyboardInterrupt:
+        log.warning("Interrupted" + (", run again with the same checkpoint to resume" if args.checkpoint else ""))
+        sys.exit(130)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    log.info("Completed in %0.2fs: %d files processed (%d valid, %d errors), %d skipped as already processed" %
+             (time.time() - tic, stats['processed'], stats['valid'], stats['errors'], stats['skipped']))
+
+
+def _float_range(value):
+    """Parses a command-line value which is either a number or a min:max range (as accepted by generate_mrz_documents)."""
+    parts = [float(v) for v in value.split(':')]
+    return parts[0] if len(parts) == 1 else tuple(parts)
+
+
+def generate_mrz():
+    """
+    A script for generating a corpus of synthetic MRZ documents (with known ground truth) for load testing and
+    benchmarking, see passporteye.mrz.synthetic.
+    """
+    parser = argparse.ArgumentParser(description='Generate synthetic document images with random valid MRZs. The file names '
+                                                 'are compatible with evaluate_mrz and passporteye-bench.')
+    parser.add_argument('output_dir', help='The directory to write the images to')
+    parser.add_argument('-n', '--count', default=100, type=int, help='The number of documents to generate (default: 100)')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='The random seed (default: 0)')
+    parser.add_argument('-t', '--types', default=None, help='Comma-separated MRZ types to generate, e.g. TD1,TD3 (default: all)')
+    parser.add_argument('--font', default=None, help='The TrueType font file for the MRZ, e.g. OCR-B')
+    parser.add_argument('--width', default=1000, type=int, help='The page width before scaling (default: 1000)')
+    parser.add_argument('--rotation', default='0', type=_float_range, help='Rotation angle in degrees or a min:max range')
+    parser.add_argument('--scale', default='1', type=_float_range, help='Scale factor or a min:max range')
+    parser.add_argument('--noise', default='0', type=_float_range, help='Noise level (0..1) or a min:max range')
+    parser.add_argument('--blur', default='0', type=_float_range, help='Blur radius in pixels or a min:max range')
+    parser.add_argument('--ground-truth', default=None, help='Save the MRZ lines of the documents as JSON to this file')
+    args = parser.parse_args()
+
+    from .synthetic import write_mrz_corpus
+    types = args.types.upper().split(',') if args.types else None
+    result = write_mrz_corpus(args.output_dir, args.count, args.seed, types, width=args.width, font=args.font,
+                              rotation=args.rotation, scale=args.scale, noise=args.noise, blur=args.blur)
+    if args.ground_truth is not None:
+        with open(args.ground_truth, 'w') as f:
+            json.dump(dict([(os.path.basename(fn), lines) for fn, lines in result]), f, indent=2)
+    print("Generated %d documents in %s" % (len(result), args.output_dir))
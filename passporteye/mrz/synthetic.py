@@ -0,0 +1,225 @@
+'''
+PassportEye::MRZ: Machine-readable zone extraction and parsing.
+Synthetic MRZ documents for load testing and benchmarking.
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import os
+import numpy as np
+from .text import MRZ, MRZCheckDigit, MRZOCRCleaner
+
+MRZ_TYPES = ['TD1', 'TD2', 'TD3', 'MRVA', 'MRVB']
+
+# The fields of each MRZ type as (line, start, end, kind). The check digits are filled in according to MRZ.CHECK_DIGITS,
+# the remaining positions are filled with random characters allowed there by MRZOCRCleaner.FORMAT (mostly <).
+FIELDS = {
+    'TD1': [(0, 0, 2, 'type'), (0, 2, 5, 'country'), (0, 5, 14, 'number'), (0, 15, 30, 'optional'),
+            (1, 0, 6, 'date'), (1, 7, 8, 'sex'), (1, 8, 14, 'date'), (1, 15, 18, 'country'), (1, 18, 29, 'optional'),
+            (2, 0, 30, 'name')],
+    'TD2': [(0, 0, 2, 'type'), (0, 2, 5, 'country'), (0, 5, 36, 'name'),
+            (1, 0, 9, 'number'), (1, 10, 13, 'country'), (1, 13, 19, 'date'), (1, 20, 21, 'sex'), (1, 21, 27, 'date'),
+            (1, 28, 35, 'optional')],
+    'TD3': [(0, 0, 2, 'type'), (0, 2, 5, 'country'), (0, 5, 44, 'name'),
+            (1, 0, 9, 'number'), (1, 10, 13, 'country'), (1, 13, 19, 'date'), (1, 20, 21, 'sex'), (1, 21, 27, 'date'),
+            (1, 28, 42, 'optional')],
+    'MRVA': [(0, 0, 2, 'type'), (0, 2, 5, 'country'), (0, 5, 44, 'name'),
+             (1, 0, 9, 'number'), (1, 10, 13, 'country'), (1, 13, 19, 'date'), (1, 20, 21, 'sex'), (1, 21, 27, 'date'),
+             (1, 28, 44, 'optional')],
+    'MRVB': [(0, 0, 2, 'type'), (0, 2, 5, 'country'), (0, 5, 36, 'name'),
+             (1, 0, 9, 'number'), (1, 10, 13, 'country'), (1, 13, 19, 'date'), (1, 20, 21, 'sex'), (1, 21, 27, 'date'),
+             (1, 28, 36, 'optional')]
+}
+
+# The first letter of the document code of each MRZ type (the second one is random)
+DOCUMENT_CODES = {'TD1': 'IAC', 'TD2': 'IAC', 'TD3': 'P', 'MRVA': 'V', 'MRVB': 'V'}
+
+_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_DIGITS = '0123456789'
+
+
+def random_mrz_lines(mrz_type, rng=None):
+    """
+    Generates the lines of a random, valid MRZ of the given type ('TD1', 'TD2', 'TD3', 'MRVA' or 'MRVB').
+
+    :param rng: a numpy.random.RandomState to draw the values from.
+
+    >>> rng = np.random.RandomState(0)
+    >>> ms = [MRZ(random_mrz_lines(tp, rng)) for tp in MRZ_TYPES*20]
+    >>> all([m.valid and m.mrz_type == tp for m, tp in zip(ms, MRZ_TYPES*20)])
+    True
+    >>> random_mrz_lines('TD2', np.random.RandomState(1)) == random_mrz_lines('TD2', np.random.RandomState(1))
+    True
+    """
+    rng = rng if rng is not None else np.random.RandomState()
+    length = MRZ.LINE_LENGTHS[mrz_type]
+    fmt = [line_fmt[:length] for line_fmt in MRZOCRCleaner._instance().FORMAT[mrz_type]]  # MRVB uses the MRVA format
+    lines = [[_random_char(f, rng, filler=0.9) for f in line_fmt] for line_fmt in fmt]
+    for ln, start, end, kind in FIELDS[mrz_type]:
+        lines[ln][start:end] = list(_random_field(kind, end - start, mrz_type, rng))
+
+    # The composite check digits (the ones over several segments) cover the other check digits, hence go last
+    for segments, (ln, pos) in sorted(MRZ.CHECK_DIGITS[mrz_type], key=lambda spec: len(spec[0])):
+        lines[ln][pos] = MRZCheckDigit.compute(''.join([''.join(lines[l][s:e]) for l, s, e in segments]))
+    return [''.join(line) for line in lines]
+
+
+def _random_char(fmt, rng, filler=0.0):
+    """A random character allowed by the given MRZOCRCleaner.FORMAT specification, which is < with probability `filler`
+    (if < is allowed)."""
+    if fmt in 'AN*' and rng.rand() < filler:
+        return '<'
+    chars = {'a': _LETTERS, 'A': _LETTERS, 'n': _DIGITS, 'N': _DIGITS, '*': _LETTERS + _DIGITS}[fmt]
+    return chars[rng.randint(len(chars))]
+
+
+def _random_word(rng, min_length=2, max_length=10):
+    return ''.join([_LETTERS[i] for i in rng.randint(len(_LETTERS), size=rng.randint(min_length, max_length + 1))])
+
+
+def _random_field(kind, length, mrz_type, rng):
+    """A random value of the given kind of field, padded with < to the given length."""
+    if kind == 'type':
+        codes = DOCUMENT_CODES[mrz_type]
+        value = codes[rng.randint(len(codes))] + ('<' if rng.rand() < 0.5 else _LETTERS[rng.randint(len(_LETTERS))])
+    elif kind == 'country':
+        value = ''.join([_LETTERS[i] for i in rng.randint(len(_LETTERS), size=3)])
+    elif kind == 'number':
+        value = ''.join([_random_char('*', rng) for i in range(rng.randint(length - 2, length + 1))])
+    elif kind == 'date':
+        # Day 28 at most, so that any day is valid in any month
+        value = '%02d%02d%02d' % (rng.randint(100), rng.randint(1, 13), rng.randint(1, 29))
+    elif kind == 'sex':
+        value = 'MF<'[rng.randint(3)]
+    elif kind == 'optional':
+        value = ''.join([_random_char('*', rng) for i in range(rng.randint(length + 1) if rng.rand() < 0.3 else 0)])
+    elif kind == 'name':
+        surname = '<'.join([_random_word(rng) for i in range(rng.randint(1, 3))])
+        names = '<'.join([_random_word(rng) for i in range(rng.randint(1, 3))])
+        value = (surname + '<<' + names)[:length]
+    return (value + '<'*length)[:length]
+
+
+def render_mrz(lines, rng=None, width=1000, rotation=0.0, scale=1.0, noise=0.0, blur=0.0, font=None, clutter=True):
+    """
+    Renders the given MRZ lines onto a synthetic document page. Returns the page as a uint8 grayscale image array.
+
+    :param rng: a numpy.random.RandomState for the random aspects of the page (the clutter and the noise).
+    :param width: the width of the page before scaling and rotation. The MRZ takes up most of it.
+    :param rotation: the angle (in degrees, counterclockwise) to rotate the page by.
+    :param scale: the factor to resize the page by.
+    :param noise: the standard deviation of the Gaussian noise added to the page (in 0..1 intensity units).
+    :param blur: the radius of the Gaussian blur applied to the page.
+    :param font: the filename of a TrueType monospace font for the MRZ (e.g. OCR-B). By default, one of the common
+                 monospace fonts is looked up, falling back to the (scaled up) default bitmap font of PIL.
+    :param clutter: when True, some random text lines and a "photo" rectangle are drawn above the MRZ.
+
+    >>> img = render_mrz(random_mrz_lines('TD3', np.random.RandomState(0)), np.random.RandomState(0), rotation=5, noise=0.05, blur=1)
+    >>> img.dtype, img.ndim
+    (dtype('uint8'), 2)
+    """
+    from PIL import Image, ImageDraw, ImageFilter
+    rng = rng if rng is not None else np.random.RandomState()
+    line_length = max([len(ln) for ln in lines])
+    char_width = int(0.9*width/line_length)
+    mrz_font = _load_font(font, char_width)
+
+    # Render the MRZ first to know its size
+    mrz_img = _render_lines(lines, mrz_font, char_width, int(char_width*1.6))
+    height = int(width*0.7)
+    page = Image.new('L', (width, height), 235 + rng.randint(21))
+    draw = ImageDraw.Draw(page)
+    margin = (width - mrz_img.size[0])//2
+    mrz_top = height - mrz_img.size[1] - margin//2
+    if clutter:
+        # A "photo" and some text lines above the MRZ, in the small default font
+        photo_width = width//4
+        draw.rectangle([margin, margin, margin + photo_width, min(margin + int(photo_width*1.3), mrz_top - margin)],
+                       fill=80 + rng.randint(80))
+        text_font = _load_font(None, char_width//2)
+        y = margin
+        while y < mrz_top - 2*char_width:
+            words = ' '.join([_random_word(rng) for i in range(rng.randint(1, 5))])
+            text_img = _render_lines([words], text_font, char_width//2, char_width)
+            page.paste(0, (margin + photo_width + margin//2, y), text_img)
+            y += int(char_width*1.5)
+    page.paste(0, (margin, mrz_top), mrz_img)
+
+    if scale != 1.0:
+        page = page.resize((max(int(width*scale), 1), max(int(height*scale), 1)), Image.BILINEAR)
+    if rotation:
+        # Rotate with a white background (the 'L' mode rotation fills with black, hence we rotate the inverted image)
+        page = Image.eval(Image.eval(page, lambda v: 255 - v).rotate(rotation, Image.BILINEAR, expand=True), lambda v: 255 - v)
+    if blur > 0:
+        page = page.filter(ImageFilter.GaussianBlur(blur))
+    img = np.asarray(page, dtype=np.float64)
+    if noise > 0:
+        img = img + rng.normal(0, noise*255, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def _load_font(font, char_width):
+    """Loads the given TrueType font (or one of the common monospace fonts), sized so that the characters are about
+    char_width wide. Returns None if no font could be loaded (_render_lines uses the default bitmap font then)."""
+    from PIL import ImageFont
+    candidates = [font] if font is not None else ['OCRB.ttf', 'OCR-B.ttf', 'DejaVuSansMono.ttf', 'LiberationMono-Regular.ttf',
+                                                   'Courier New.ttf', 'cour.ttf']
+    for fn in candidates:
+        try:
+            return ImageFont.truetype(fn, int(char_width/0.6))
+        except IOError:
+            if font is not None:
+                raise
+    return None
+
+
+def _render_lines(lines, font, char_width, line_height):
+    """Renders the lines of text in black on a transparent background, each character in a cell of the given width.
+    Returns the result as an 'L' mode image, where the text pixels are 255 (i.e. a mask to paste black through)."""
+    from PIL import Image, ImageDraw, ImageFont
+    if font is None:
+        # The default bitmap font is about 6x11, hence we render at that size and scale up
+        base = _render_lines(lines, ImageFont.load_default(), 6, 11)
+        return base.resize((base.size[0]*char_width//6, base.size[1]*line_height//11), Image.NEAREST)
+    img = Image.new('L', (char_width*max([len(ln) for ln in lines]), line_height*len(lines)), 0)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        for j, c in enumerate(line):
+            draw.text((j*char_width, i*line_height), c, fill=255, font=font)
+    return img
+
+
+def generate_mrz_documents(n, seed=0, types=None, **render_params):
+    """
+    Yields (lines, image) pairs for n random documents: the lines of a valid MRZ of a random type and
+    a rendering of it (see render_mrz). Document i only depends on the seed and i, so that a corpus
+    may be generated reproducibly (and in parts).
+
+    :param types: the list of MRZ types to choose from. Defaults to all of MRZ_TYPES.
+    :param render_params: the parameters to render_mrz. Instead of a single value, any numeric parameter may be given
+                          as a (min, max) pair, in which case the value is chosen uniformly at random for each document.
+    """
+    types = types or MRZ_TYPES
+    for i in range(n):
+        rng = np.random.RandomState([seed, i])
+        lines = random_mrz_lines(types[rng.randint(len(types))], rng)
+        params = dict([(k, rng.uniform(*v) if isinstance(v, (tuple, list)) else v) for k, v in render_params.items()])
+        yield lines, render_mrz(lines, rng, **params)
+
+
+def write_mrz_corpus(directory, n, seed=0, types=None, **render_params):
+    """
+    Writes n random documents (see generate_mrz_documents) as PNG files to the given directory.
+    The file names (e.g. 100_synth-000042-td3.png) start with the expected valid_score, as the sample
+    test data files do, so the corpus may be used with evaluate_mrz and passporteye-bench.
+    Returns the list of (filename, lines) pairs.
+    """
+    from PIL import Image
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    result = []
+    for i, (lines, img) in enumerate(generate_mrz_documents(n, seed, types, **render_params)):
+        filename = os.path.join(directory, '100_synth-%06d-%s.png' % (i, MRZ(lines).mrz_type.lower()))
+        Image.fromarray(img).save(filename)
+        result.append((filename, lines))
+    return result
@@ -6,6 +6,7 @@ Author: Konstantin Tretyakov
 License: MIT
 '''
 from collections import OrderedDict
+import numpy as np
 
 class MRZ(object):
     """
@@ -115,6 +116,71 @@ class MRZ(object):
         """Given a single string which is output from an OCR routine, cleans it up using MRZ.ocr_cleanup and creates a MRZ object"""
         return MRZ(MRZOCRCleaner.apply(mrz_ocr_string))
 
+    # The check digits of each MRZ type: a list of ([(line, start, end), ...], (line, check_digit_position)) pairs,
+    # in the order of valid_check_digits. Used by parse_many.
+    CHECK_DIGITS = {
+        'TD1': [([(0, 5, 14)], (0, 14)), ([(1, 0, 6)], (1, 6)), ([(1, 8, 14)], (1, 14)),
+                ([(0, 5, 30), (1, 0, 7), (1, 8, 15), (1, 18, 29)], (1, 29))],
+        'TD2': [([(1, 0, 9)], (1, 9)), ([(1, 13, 19)], (1, 19)), ([(1, 21, 27)], (1, 27)),
+                ([(1, 0, 10), (1, 13, 20), (1, 21, 35)], (1, 35))],
+        'TD3': [([(1, 0, 9)], (1, 9)), ([(1, 13, 19)], (1, 19)), ([(1, 21, 27)], (1, 27)),
+                ([(1, 0, 10), (1, 13, 20), (1, 21, 43)], (1, 43)), ([(1, 28, 42)], (1, 42))],
+        'MRVA': [([(1, 0, 9)], (1, 9)), ([(1, 13, 19)], (1, 19)), ([(1, 21, 27)], (1, 27))],
+        'MRVB': [([(1, 0, 9)], (1, 9)), ([(1, 13, 19)], (1, 19)), ([(1, 21, 27)], (1, 27))]
+    }
+    LINE_LENGTHS = {'TD1': 30, 'TD2': 36, 'TD3': 44, 'MRVA': 44, 'MRVB': 36}
+
+    @staticmethod
+    def parse_many(mrz_lines_list):
+        """Parses a batch of MRZs, each given as a list of lines, returning a list of MRZ objects.
+        The result is the same as [MRZ(lines) for lines in mrz_lines_list], but the check digits of all
+        MRZs of the same type are verified at once using NumPy, which is much faster for large batches.
+
+        >>> ms = MRZ.parse_many([['IDAUT10000999<6<<<<<<<<<<<<<<<', '7109094F1112315AUT<<<<<<<<<<<4', 'MUSTERFRAU<<ISOLDE<<<<<<<<<<<<'],
+        ...                      ['P<POLKOWALSKA<KWIATKOWSKA<<JOANNA<<<<<<<<<<<', 'AA00000000POL6002084F1412314<<<<<<<<<<<<<<<4'],
+        ...                      ['IDAUT10000999<6<<<<<<<<<<<<<<<', '7109094F1112315AUT<<<<<<<<<<<6', 'MUSTERFRAU<<ISOLDE<<<<<<<<<<<<'],
+        ...                      ['I<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<', 'D231458907UTO7408122F1204159<<<<<<<6'], [], [1, 2, 3]])
+        >>> [(m.mrz_type, m.valid) for m in ms]
+        [('TD1', True), ('TD3', True), ('TD1', False), ('TD2', True), (None, False), (None, False)]
+        >>> assert ms[2].valid_check_digits == [True, True, True, False] and ms[1].surname == 'KOWALSKA KWIATKOWSKA'
+        """
+        groups = {}
+        for i, lines in enumerate(mrz_lines_list):
+            tp = MRZ._guess_type(lines)
+            if tp is not None:
+                try:
+                    length = MRZ.LINE_LENGTHS[tp]
+                    lines = [_ascii_bytes((ln + '<'*length)[:length]) for ln in lines]
+                except Exception:
+                    tp = None  # Not a list of strings, the MRZ constructor will deal with it
+            groups.setdefault(tp, []).append((i, lines))
+
+        result = [None]*len(mrz_lines_list)
+        for tp, items in groups.items():
+            if tp is None:
+                for i, _ in items:
+                    result[i] = MRZ(mrz_lines_list[i])
+                continue
+            # A len(items) x line_length array of character codes for each line
+            lines = [np.frombuffer(b''.join([item[1][j] for item in items]), dtype=np.uint8).reshape(len(items), -1)
+                     for j in range(len(items[0][1]))]
+            valid = [MRZCheckDigit.verify_many(np.hstack([lines[ln][:, start:end] for ln, start, end in segments]),
+                                               lines[check[0]][:, check[1]])
+                     for segments, check in MRZ.CHECK_DIGITS[tp]]
+            if tp == 'TD3':
+                # The personal number is optional, in which case it is left empty with a check digit of < or 0
+                ord_lt, ord_0 = ord('<'), ord('0')
+                no_pn = np.all(lines[1][:, 28:42] == ord_lt, axis=1) & \
+                        ((lines[1][:, 42] == ord_lt) | (lines[1][:, 42] == ord_0))
+                valid[4] = valid[4] | no_pn
+            valid = np.column_stack(valid).tolist()
+            for (i, _), valid_check_digits in zip(items, valid):
+                m = MRZ.__new__(MRZ)
+                m._parse(mrz_lines_list[i], valid_check_digits)
+                m.aux = {}
+                result[i] = m
+        return result
+
     def __repr__(self):
         if self.valid:
             return "MRZ({0}[valid], {1}, {2}, {3}, {4}, {5})".format(self.mrz_type, self.number, self.names, self.surname, self.sex, self.date_of_birth)
@@ -157,19 +223,21 @@ class MRZ(object):
         except:
             return None
 
-    def _parse(self, mrz_lines):
+    def _parse(self, mrz_lines, valid_check_digits=None):
+        """Parses the lines, filling in the fields of this object.
+        valid_check_digits may be given if they have already been verified (see parse_many)."""
         self.mrz_type = MRZ._guess_type(mrz_lines)
         try:
             if self.mrz_type == 'TD1':
-                self.valid = self._parse_td1(*mrz_lines)
+                self.valid = self._parse_td1(*mrz_lines, valid_check_digits=valid_check_digits)
             elif self.mrz_type == 'TD2':
-                self.valid = self._parse_td2(*mrz_lines)
+                self.valid = self._parse_td2(*mrz_lines, valid_check_digits=valid_check_digits)
             elif self.mrz_type == 'TD3':
-                self.valid = self._parse_td3(*mrz_lines)
+                self.valid = self._parse_td3(*mrz_lines, valid_check_digits=valid_check_digits)
             elif self.mrz_type == 'MRVA':
-                self.valid = self._parse_mrv(*mrz_lines, length=44)
+                self.valid = self._parse_mrv(*mrz_lines, length=44, valid_check_digits=valid_check_digits)
             elif self.mrz_type == 'MRVB':
-                self.valid = self._parse_mrv(*mrz_lines, length=36)
+                self.valid = self._parse_mrv(*mrz_lines, length=36, valid_check_digits=valid_check_digits)
             else:
                 self.valid = False
                 self.valid_score = 0
@@ -224,7 +292,7 @@ class MRZ(object):
                 result['method'] = self.aux['method']
         return result
 
-    def _parse_td1(self, a, b, c):
+    def _parse_td1(self, a, b, c, valid_check_digits=None):
         len_a, len_b, len_c = len(a), len(b), len(c)
         if len(a) < 30:
             a = a + '<'*(30 - len(a))
@@ -252,10 +320,12 @@ class MRZ(object):
         self.names = self.names.replace('<', ' ').strip()
         self.surname = self.surname.replace('<', ' ').strip()
 
-        self.valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
-                            MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
-                            MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
-                            MRZCheckDigit.compute(a[5:30] + b[0:7] + b[8:15] + b[18:29]) == self.check_composite]
+        if valid_check_digits is None:
+            valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
+                                  MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
+                                  MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
+                                  MRZCheckDigit.compute(a[5:30] + b[0:7] + b[8:15] + b[18:29]) == self.check_composite]
+        self.valid_check_digits = valid_check_digits
         self.valid_line_lengths = [len_a == 30, len_b == 30, len_c == 30]
         self.valid_misc = [a[0] in 'IAC']
         self.valid_score = 10*sum(self.valid_check_digits) + sum(self.valid_line_lengths) + sum(self.valid_misc) + 1
@@ -264,7 +334,7 @@ class MRZ(object):
         return self.valid_score == 100
 
 
-    def _parse_td2(self, a, b):
+    def _parse_td2(self, a, b, valid_check_digits=None):
         len_a, len_b = len(a), len(b)
         if len(a) < 36:
             a = a + '<'*(36 - len(a))
@@ -288,10 +358,12 @@ class MRZ(object):
         self.check_expiration_date = b[27]
         self.optional1 = b[28:35]
         self.check_composite = b[35]
-        self.valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
-                             MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
-                             MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
-                             MRZCheckDigit.compute(b[0:10] + b[13:20] + b[21:35]) == self.check_composite]
+        if valid_check_digits is None:
+            valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
+                                  MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
+                                  MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
+                                  MRZCheckDigit.compute(b[0:10] + b[13:20] + b[21:35]) == self.check_composite]
+        self.valid_check_digits = valid_check_digits
         self.valid_line_lengths = [len_a == 36, len_b == 36]
         self.valid_misc = [a[0] in 'ACI']
         self.valid_score = 10*sum(self.valid_check_digits) + sum(self.valid_line_lengths) + sum(self.valid_misc) +1
@@ -300,7 +372,7 @@ class MRZ(object):
         return self.valid_score == 100
 
 
-    def _parse_td3(self, a, b):
+    def _parse_td3(self, a, b, valid_check_digits=None):
         len_a, len_b = len(a), len(b)
         if len(a) < 44:
             a = a + '<'*(44 - len(a))
@@ -325,12 +397,14 @@ class MRZ(object):
         self.personal_number = b[28:42]
         self.check_personal_number = b[42]
         self.check_composite = b[43]
-        self.valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
-                             MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
-                             MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
-                             MRZCheckDigit.compute(b[0:10] + b[13:20] + b[21:43]) == self.check_composite,
-                             ((self.check_personal_number == '<' or self.check_personal_number == '0') and self.personal_number == '<<<<<<<<<<<<<<') # PN is optional
-                                or MRZCheckDigit.compute(self.personal_number) == self.check_personal_number]
+        if valid_check_digits is None:
+            valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
+                                  MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
+                                  MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date,
+                                  MRZCheckDigit.compute(b[0:10] + b[13:20] + b[21:43]) == self.check_composite,
+                                  ((self.check_personal_number == '<' or self.check_personal_number == '0') and self.personal_number == '<<<<<<<<<<<<<<') # PN is optional
+                                    or MRZCheckDigit.compute(self.personal_number) == self.check_personal_number]
+        self.valid_check_digits = valid_check_digits
         self.valid_line_lengths = [len_a == 44, len_b == 44]
         self.valid_misc = [a[0] in 'P']
         self.valid_score = 10*sum(self.valid_check_digits) + sum(self.valid_line_lengths) + sum(self.valid_misc) +1
@@ -339,7 +413,7 @@ class MRZ(object):
         return self.valid_score == 100
 
 
-    def _parse_mrv(self, a, b, length=44):
+    def _parse_mrv(self, a, b, length=44, valid_check_digits=None):
         len_a, len_b = len(a), len(b)
         if len(a) < length:
             a = a + '<'*(44 - len(a))
@@ -362,9 +436,11 @@ class MRZ(object):
         self.expiration_date = b[21:27]
         self.check_expiration_date = b[27]
         self.optional1 = b[28:length]
-        self.valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
-                             MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
-                             MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date]
+        if valid_check_digits is None:
+            valid_check_digits = [MRZCheckDigit.compute(self.number) == self.check_number,
+                                  MRZCheckDigit.compute(self.date_of_birth) == self.check_date_of_birth,
+                                  MRZCheckDigit.compute(self.expiration_date) == self.check_expiration_date]
+        self.valid_check_digits = valid_check_digits
         self.valid_line_lengths = [len_a == length, len_b == length]
         self.valid_misc = [a[0]=='V']
         self.valid_score = 10*sum(self.valid_check_digits) + sum(self.valid_line_lengths) + sum(self.valid_misc) + 1
@@ -409,6 +485,21 @@ class MRZOCRCleaner(object):
         n = {'B': '8', 'C': '0', 'D': '0', 'G': '6', 'I': '1', 'O': '0', 'Q': '0', 'S': '5', 'Z': '2'}
         self.FIXERS = {'a': a, 'A': a, 'n': n, 'N': n, '*': {}}
 
+        # For each line format, the list of its (start, end, translation_table) runs of positions with the same fixer,
+        # so that a line may be fixed in a few str.translate calls rather than character by character.
+        tables = dict([(k, _translation_table(v)) for k, v in self.FIXERS.items()])
+        self.RUNS = {}
+        for tp, fmt in self.FORMAT.items():
+            self.RUNS[tp] = []
+            for line_fmt in fmt:
+                runs = []
+                for j, f in enumerate(line_fmt):
+                    if runs and self.FIXERS[line_fmt[runs[-1][0]]] is self.FIXERS[f]:
+                        runs[-1][1] = j + 1
+                    else:
+                        runs.append([j, j + 1, tables[f]])
+                self.RUNS[tp].append([tuple(r) for r in runs])
+
     def _split_lines(self, mrz_ocr_string):
         return [ln for ln in mrz_ocr_string.replace(' ', '').split('\n') if (len(ln) >= 20 or '<<' in ln)]
 
@@ -430,6 +521,12 @@ class MRZOCRCleaner(object):
         return lines
 
     def _fix_line(self, line, type, line_idx):
+        fmt_length = len(self.FORMAT[type][line_idx])
+        upper = line[:fmt_length].upper()
+        if isinstance(line, str) and len(upper) == min(len(line), fmt_length):
+            return ''.join([upper[start:end].translate(table) for start, end, table in self.RUNS[type][line_idx]]) + \
+                   line[fmt_length:]
+        # Unicode strings in Python 2 (and unusual characters, which change length when uppercased) are fixed one by one
         ln = list(line)
         for j in range(len(ln)):
             ln[j] = self._fix_char(ln[j], type, line_idx, j)
@@ -446,9 +543,24 @@ class MRZOCRCleaner(object):
 
     @staticmethod
     def apply(txt):
+        return MRZOCRCleaner._instance()(txt)
+
+    @staticmethod
+    def _instance():
         if getattr(MRZOCRCleaner, '__instance__', None) is None:
             MRZOCRCleaner.__instance__ = MRZOCRCleaner()
-        return MRZOCRCleaner.__instance__(txt)
+        return MRZOCRCleaner.__instance__
+
+
+def _translation_table(mapping):
+    """Converts a character mapping dictionary to a table for str.translate."""
+    keys = ''.join(sorted(mapping.keys()))
+    values = ''.join([mapping[k] for k in keys])
+    try:
+        return str.maketrans(keys, values)
+    except AttributeError:  # Python 2
+        import string
+        return string.maketrans(keys, values)
 
 
 class MRZCheckDigit(object):
@@ -486,6 +598,13 @@ class MRZCheckDigit(object):
         self.CHECK_CODES['<'] = 0
         self.CHECK_WEIGHTS = [7, 3, 1]
 
+        # The same as NumPy lookup tables indexed by character codes (used by compute_many and verify_many)
+        self.CODE_TABLE = np.full(256, -1000, dtype=np.int64)
+        for c, code in self.CHECK_CODES.items():
+            self.CODE_TABLE[ord(c)] = code
+        self.DIGIT_TABLE = np.full(256, -1, dtype=np.int64)
+        self.DIGIT_TABLE[ord('0'):ord('9')+1] = np.arange(10)
+
     def __call__(self, txt):
         if txt == '':
             return ''
@@ -495,9 +614,55 @@ class MRZCheckDigit(object):
         else:
             return str(res % 10)
 
+    def _sums(self, codes):
+        """Given an n x k uint8 array of character codes, returns the n weighted sums of their check codes."""
+        weights = np.resize(np.asarray(self.CHECK_WEIGHTS, dtype=np.int64), codes.shape[1])
+        return self.CODE_TABLE[codes].dot(weights)
+
     @staticmethod
     def compute(txt):
+        return MRZCheckDigit._instance()(txt)
+
+    @staticmethod
+    def compute_many(txts):
+        """Same as [MRZCheckDigit.compute(txt) for txt in txts], but vectorized, which is much faster for large lists.
+
+        >>> MRZCheckDigit.compute_many(['0', '111<<<111111', 'BCDEFGHIJ', '123456789', '', '0 0', 'BBb<<<1B1<<<BB1'])
+        ['0', '3', '7', '7', '', '', '']
+        """
+        if len(txts) == 0:
+            return []
+        self = MRZCheckDigit._instance()
+        txts = [_ascii_bytes(t) for t in txts]
+        # Trailing <'s do not change the check digit, hence we may pad the strings with them
+        width = max([len(t) for t in txts])
+        codes = np.frombuffer(b''.join([t.ljust(width, b'<') for t in txts]), dtype=np.uint8).reshape(len(txts), width)
+        sums = self._sums(codes)
+        return ['' if len(t) == 0 or res < 0 else str(res % 10) for t, res in zip(txts, sums.tolist())]
+
+    @staticmethod
+    def verify_many(codes, check_digits):
+        """Given an n x k uint8 array of character codes of n strings (of the same length k > 0)
+        and an array of n character codes of their check digits, returns a boolean array, indicating which of the check digits
+        are valid, i.e. MRZCheckDigit.compute(txt) == check_digit.
+
+        >>> MRZCheckDigit.verify_many(np.array([[49, 49, 49], [49, 49, 49], [98, 60, 60]], dtype=np.uint8), np.array([49, 48, 48]))
+        array([ True, False, False])
+        """
+        self = MRZCheckDigit._instance()
+        sums = self._sums(codes)
+        return (sums >= 0) & (sums % 10 == self.DIGIT_TABLE[check_digits])
+
+    @staticmethod
+    def _instance():
         if getattr(MRZCheckDigit, '__instance__', None) is None:
             MRZCheckDigit.__instance__ = MRZCheckDigit()
-        return MRZCheckDigit.__instance__(txt)
+        return MRZCheckDigit.__instance__
+
+
+def _ascii_bytes(txt):
+    """Converts a string to bytes, one per character, replacing non-ASCII characters (which are not valid in MRZs) with '?'."""
+    if isinstance(txt, bytes):
+        return txt
+    return txt.encode('ascii', 'replace')
 
@@ -0,0 +1,181 @@
+'''
+PassportEye::Util: Result caches
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import os, pickle, sqlite3, threading, time
+from collections import OrderedDict
+
+
+class Cache(object):
+    """
+    Base class for the result caches. A cache maps string keys to arbitrary (picklable) values.
+    Any object with the `get(key, default)` and `put(key, value)` methods may be used as a cache by read_mrz,
+    this class only provides the common bookkeeping: hit/miss statistics and the size and age limits.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        """
+        :param max_size: the maximum number of entries to keep. When exceeded, the least recently used entries are evicted.
+                         None means no limit.
+        :param ttl: the number of seconds an entry is valid for. None means forever.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._stats = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """A dictionary with the number of cache hits, misses, puts and evictions (in this process), as well as the current size."""
+        with self._lock:
+            result = dict(self._stats)
+        result['size'] = len(self)
+        return result
+
+    def _count(self, stat, n=1):
+        self._stats[stat] += n
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class MemoryCache(Cache):
+    """
+    An in-memory LRU cache, shared by all threads of a process.
+
+    >>> c = MemoryCache(max_size=2)
+    >>> c.put('a', 1); c.put('b', 2)
+    >>> c.get('a'), c.get('c'), c.get('c', 'missing')
+    (1, None, 'missing')
+    >>> c.put('c', 3)  # Evicts 'b', which is now the least recently used one
+    >>> c.get('b'), c.get('c'), len(c)
+    (None, 3, 2)
+    >>> sorted(c.stats.items())
+    [('evictions', 1), ('hits', 2), ('misses', 3), ('puts', 3), ('size', 2)]
+    >>> c = MemoryCache(ttl=0.01); c.put('a', 1); time.sleep(0.02)
+    >>> c.get('a'), len(c)
+    (None, 0)
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        super(MemoryCache, self).__init__(max_size, ttl)
+        self._entries = OrderedDict()  # key -> (creation time, value), from the least to the most recently used
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and self._expired(entry[0], time.time()):
+                entry = None
+            if entry is None:
+                self._count('misses')
+                return default
+            self._entries[key] = entry
+            self._count('hits')
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), value)
+            self._count('puts')
+            while self.max_size is not None and len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._count('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache(Cache):
+    """
+    A persistent cache, kept in an SQLite database file. Values are stored pickled.
+    The same file may be used by several threads and processes at once (e.g. by the workers of read_mrz_batch).
+
+    >>> import tempfile, shutil
+    >>> tmp = tempfile.mkdtemp()
+    >>> c = DiskCache(os.path.join(tmp, 'cache.db'), max_size=2)
+    >>> c.put('a', [1]); c.put('b', [2]); c.get('a'); c.put('c', [3])
+    [1]
+    >>> c.get('b'), c.get('c'), len(c), c.stats['evictions']
+    (None, [3], 2, 1)
+    >>> DiskCache(os.path.join(tmp, 'cache.db')).get('a')  # The data persists
+    [1]
+    >>> shutil.rmtree(tmp)
+    """
+
+    def __init__(self, path, max_size=None, ttl=None):
+        """
+        :param path: the name of the database file. It is created if it does not exist.
+        """
+        super(DiskCache, self).__init__(max_size, ttl)
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def _connection(self):
+        """Returns the connection to the database for the current thread (SQLite connections may not be shared by threads)."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=60)
+        return db
+
+    def get(self, key, default=None):
+        db, now = self._connection(), time.time()
+        with db:
+            row = db.execute('SELECT value, created FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and self._expired(row[1], now):
+                db.execute('DELETE FROM cache WHERE key = ?', (key,))
+                row = None
+            if row is not None:
+                db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self._count('misses' if row is None else 'hits')
+        return default if row is None else pickle.loads(bytes(row[0]))
+
+    def put(self, key, value):
+        db, now = self._connection(), time.time()
+        data = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with db:
+            db.execute('INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)', (key, data, now, now))
+            evicted = 0
+            if self.max_size is not None:
+                evicted = db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                                     (self.max_size,)).rowcount
+            if self.ttl is not None:
+                evicted += db.execute('DELETE FROM cache WHERE created < ?', (now - self.ttl,)).rowcount
+        with self._lock:
+            self._count('puts')
+            self._count('evictions', evicted)
+
+    def clear(self):
+        with self._connection() as db:
+            db.execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def __getstate__(self):
+        state = super(DiskCache, self).__getstate__()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        super(DiskCache, self).__setstate__(state)
+        self._local = threading.local()
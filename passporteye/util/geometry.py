@@ -5,9 +5,6 @@ Author: Konstantin Tretyakov
 License: MIT
 '''
 import numpy as np
-from sklearn.decomposition import PCA
-from matplotlib import pyplot as plt
-from matplotlib import patches
 from skimage import transform
 
 
@@ -88,8 +85,8 @@ class RotatedBox(object):
                [-1.,  2.],
                [-1., -2.]])
         """
-        v_hor = (self.width/2 + margin_width)*np.array([np.cos(self.angle), np.sin(self.angle)])
-        v_vert = (self.height/2 + margin_height)*np.array([-np.sin(self.angle), np.cos(self.angle)])
+        v_hor = (self.width/2.0 + margin_width)*np.array([np.cos(self.angle), np.sin(self.angle)])
+        v_vert = (self.height/2.0 + margin_height)*np.array([-np.sin(self.angle), np.cos(self.angle)])
         c = np.array([self.cx, self.cy])
         return np.vstack([c - v_hor - v_vert, c + v_hor - v_vert, c + v_hor + v_vert, c - v_hor + v_vert])
 
@@ -105,6 +102,7 @@ class RotatedBox(object):
         :param kwargs: arguments passed to the matplotlib's `Polygon` patch object. By default, fill is set to False, color to red and lw to 2.
         :return: The created Polygon object.
         """
+        from matplotlib import pyplot as plt, patches  # Only needed for plotting, hence imported lazily
         ax = ax or plt.gca()
         poly = self.as_poly()
         if mode == 'image':
@@ -134,63 +132,61 @@ class RotatedBox(object):
         :param margin_height: The margin that should be added to the height dimension of the box from each side.
         :return: a numpy ndarray, corresponding to the extracted region (aligned straight).
 
-        TODO: This could be made more efficient if we avoid rotating the full image and cut out the ROI from it beforehand.
-        """
-        rotate_by = (np.pi/2 - self.angle)*180/np.pi
-        img_rotated = transform.rotate(img, angle=rotate_by, center=[self.center[1]*scale, self.center[0]*scale], resize=True)
-        # The resizeable transform will shift the resulting image somewhat wrt original coordinates.
-        # When we cut out the box we will compensate for this shift.
-        shift_c, shift_r = self._compensate_rotation_shift(img, scale)
-
-        r1 = max(int((self.center[0] - self.height/2 - margin_height)*scale - shift_r), 0)
-        r2 = int((self.center[0] + self.height/2 + margin_height)*scale - shift_r)
-        c1 = max(int((self.center[1] - self.width/2 - margin_width)*scale - shift_c), 0)
-        c2 = int((self.center[1] + self.width/2 + margin_width)*scale - shift_c)
-        return img_rotated[r1:r2, c1:c2]
-
-    def _compensate_rotation_shift(self, img, scale):
-        """This is an auxiliary method used by extract_from_image.
-        It is needed due to particular specifics of the skimage.transform.rotate implementation.
-        Namely, when you use rotate(... , resize=True), the rotated image is rotated and shifted by certain amount.
-        Thus when we need to cut out the box from the image, we need to account for this shift.
-        We do this by repeating the computation from skimage.transform.rotate here.
-
-        TODO: This makes the code uncomfortably coupled to SKImage (e.g. this logic is appropriate for skimage 0.12.1, but not for 0.11,
-        and no one knows what happens in later versions). A solution would be to use skimage.transform.warp with custom settings, but we can think of it later.
+        Only the pixels of the output window are computed (via a single affine warp) from the part of the image under it,
+        hence the cost of the operation is proportional to the size of the box rather than the size of the image.
+        The result is a float64 array with values in [0, 1] (for integer images) whatever the type of the image.
+
+        >>> img = np.zeros((100, 200)); img[40:50, 20:180] = 1
+        >>> roi = RotatedBox([45, 100], 160, 10, np.pi/2).extract_from_image(img, margin_width=0, margin_height=0)
+        >>> roi.shape, roi.min()
+        ((10, 160), 1.0)
+        >>> roi = RotatedBox([22.5, 50], 80, 5, np.pi/2).extract_from_image(img, 2.0, 0, 0)
+        >>> roi.shape, roi.min()
+        ((10, 160), 1.0)
+        >>> roi = RotatedBox([45, 100], 160, 10, -np.pi/2).extract_from_image(img, margin_width=5, margin_height=0)
+        >>> roi.shape, roi[2:-2, 8:-8].min(), roi[:, :3].max()
+        ((10, 170), 1.0, 0.0)
+        >>> roi = RotatedBox([45, 100], 160, 10, np.pi/2 - 0.1).extract_from_image((img*255).astype(np.uint8))
+        >>> roi.dtype, roi.shape
+        (dtype('float64'), (20, 170))
         """
+        # We "unrotate" the image around the (scaled) center of the box by rotate_by and cut out
+        # the window [r1:r2, c1:c2] from the result, the coordinates of which are given here.
+        rotate_by = np.pi/2 - self.angle
+        r1 = int((self.center[0] - self.height/2.0 - margin_height)*scale)
+        r2 = int((self.center[0] + self.height/2.0 + margin_height)*scale)
+        c1 = int((self.center[1] - self.width/2.0 - margin_width)*scale)
+        c2 = int((self.center[1] + self.width/2.0 + margin_width)*scale)
+
+        # Mapping (x, y) = (column, row) coordinates of the unrotated image to the coordinates of the original one
         ctr = np.asarray([self.center[1]*scale, self.center[0]*scale])
-        tform1 = transform.SimilarityTransform(translation=ctr)
-        tform2 = transform.SimilarityTransform(rotation=np.pi/2 - self.angle)
-        tform3 = transform.SimilarityTransform(translation=-ctr)
-        tform = tform3 + tform2 + tform1
+        tform = transform.SimilarityTransform(translation=-ctr) + \
+                transform.SimilarityTransform(rotation=rotate_by) + \
+                transform.SimilarityTransform(translation=ctr)
 
+        # Do not extend the window beyond the bounds of the unrotated image
         rows, cols = img.shape[0], img.shape[1]
-        corners = np.array([
-            [0, 0],
-            [0, rows - 1],
-            [cols - 1, rows - 1],
-            [cols - 1, 0]
-        ])
-        corners = tform.inverse(corners)
-        minc = corners[:, 0].min()
-        minr = corners[:, 1].min()
-        maxc = corners[:, 0].max()
-        maxr = corners[:, 1].max()
-
-        # SKImage 0.11 version
-        out_rows = maxr - minr + 1
-        out_cols = maxc - minc + 1
-
-        # fit output image in new shape
-        return ((cols - out_cols) / 2., (rows - out_rows) / 2.)
-
+        corners = tform.inverse(np.array([[0, 0], [0, rows - 1], [cols - 1, rows - 1], [cols - 1, 0]]))
+        r1, c1 = max(r1, int(np.floor(corners[:, 1].min()))), max(c1, int(np.floor(corners[:, 0].min())))
+        r2, c2 = min(r2, int(np.ceil(corners[:, 1].max())) + 1), min(c2, int(np.ceil(corners[:, 0].max())) + 1)
+
+        # Warping maps output coordinates to input ones, hence the output window must be shifted into place first
+        tform = transform.SimilarityTransform(translation=(c1, r1)) + tform
+        h, w = max(r2 - r1, 0), max(c2 - c1, 0)
+
+        # Only the part of the image under the window (plus a margin for the interpolation) is needed. Cutting it out
+        # before warping saves warp from converting the whole image to float64 (e.g. when the image is uint8)
+        src = tform(np.array([[0, 0], [0, h], [w, h], [w, 0]]))
+        sr1, sc1 = [min(max(int(np.floor(src[:, i].min())) - 3, 0), n - 1) for i, n in [(1, rows), (0, cols)]]
+        sr2, sc2 = [max(min(int(np.ceil(src[:, i].max())) + 4, n), m + 1) for i, n, m in [(1, rows, sr1), (0, cols, sc1)]]
+        tform = tform + transform.SimilarityTransform(translation=(-sc1, -sr1))
+        return transform.warp(img[sr1:sr2, sc1:sc2], tform, output_shape=(h, w))
 
     @staticmethod
     def from_points(points, box_type='bb'):
         """
         Interpret a given point cloud as a RotatedBox, using PCA to determine the potential orientation (the longest component becomes width)
-        This is basically an approximate version of a min-area-rectangle algorithm.
-        TODO: Test whether using a true min-area-rectangle algorithm would be more precise or faster.
+        This is basically an approximate version of a min-area-rectangle algorithm (which is also available as box_type='minarea').
 
         :param points: An n x 2 numpy array of coordinates.
         :param box_type: The kind of method used to estimate the "box".
@@ -201,6 +197,9 @@ class RotatedBox(object):
                           10% and 90% quantile of the corresponding coordinates (rather than 0% and 100%, i.e. min and max).
                           This helps against accidental noise in the contour.
                           The `'mrz'` correction is only applied when there are at least 10 points in the set.
+                - `'minarea'`, denoting the true minimum-area bounding rectangle (found using rotating calipers
+                          on the convex hull of the points). Its orientation is not affected by the distribution of points
+                          inside the box, but it is slower than the PCA-based approaches.
         :returns: a RotatedBox, bounding the given set of points, oriented according to the principal components.
 
         >>> RotatedBox.from_points([[0,0]])
@@ -211,38 +210,45 @@ class RotatedBox(object):
         >>> assert RotatedBox.from_points([[0,0], [2,4], [0,4], [2,0]]).approx_equal([1, 2], 4, 2, np.pi/2)
         >>> assert RotatedBox.from_points([[0,0], [1,1.5], [2,0]]).approx_equal([1, 0.75], 2, 1.5, 0)
         >>> assert RotatedBox.from_points([[0,0], [0,1], [1,1]]).approx_equal([0.25, 0.75], np.sqrt(2), np.sqrt(2)/2, np.pi/4)
+
+        # The minimum-area rectangle of a triangle has a side along one of the triangle's sides
+        >>> assert RotatedBox.from_points([[0,0], [0,1], [1,1]], 'minarea').approx_equal([0.5, 0.5], 1, 1, 0)
+        >>> assert RotatedBox.from_points([[0,0], [4,3], [3,4], [-1,1]], 'minarea').approx_equal([1.5, 2], 5.2, 1.4, np.arctan2(3, 4))
+        >>> assert RotatedBox.from_points([[0,0], [1,1], [2,2]], 'minarea').approx_equal([1, 1], np.sqrt(8), 0, np.pi/4)
         """
         points = np.asfarray(points)
         if points.shape[0] == 1:
             return RotatedBox(points[0], width=0.0, height=0.0, angle=0.0, points=points)
+        if box_type == 'minarea':
+            return RotatedBox._min_area_box(points)
 
-        m = PCA(2).fit(points)
+        mean, components = RotatedBox._principal_components(points)
         # Find the angle
-        angle = (np.arctan2(m.components_[0,1], m.components_[0,0]) % np.pi)
+        angle = (np.arctan2(components[0,1], components[0,0]) % np.pi)
         if abs(angle - np.pi) < angle:
             # Here the angle is always between -pi and pi
             # If the principal component happened to be oriented so that the angle happens to be > pi/2 by absolute value,
             # we flip the direction
             angle = angle - np.pi if angle > 0 else angle + np.pi
-        points_transformed = m.transform(points)
+        points_transformed = np.dot(points - mean, components.T)
         ll = np.min(points_transformed, 0)
         ur = np.max(points_transformed, 0)
         wh = ur - ll
 
         # Now compute and return the bounding box
         if box_type == 'bb' or (box_type == 'mrz' and points.shape[0] < 10):
-            # We know that if we rotate the points around m.mean_, we get a box with bounds ur and ll
+            # We know that if we rotate the points around the mean, we get a box with bounds ur and ll
             # The center of this box is (ur+ll)/2 + mean, which is not the same as the mean,
             # hence to get the center of the original box we need to "unrotate" this box back.
-            return RotatedBox(np.dot(m.components_.T, (ll+ur)/2) + m.mean_, width=wh[0], height=wh[1], angle=angle, points=points)
+            return RotatedBox(np.dot(components.T, (ll+ur)/2) + mean, width=wh[0], height=wh[1], angle=angle, points=points)
         elif box_type == 'mrz':
             # When working with MRZ detection from contours, we may have minor "bumps" in the contour,
             # that should be ignored at least along the long ("horizontal") side.
             # To do that, we will use 10% and 90% quantiles as the bounds of the box instead of the max and min.
             # We drop all points which lie beyond and simply repeat the estimation (now 'bb-style') without them.
-            h_coord = sorted(points_transformed[:,1])
+            h_coord = np.sort(points_transformed[:,1])
             n = len(h_coord)
-            bottom, top = h_coord[n/10], h_coord[n*9/10]
+            bottom, top = h_coord[n//10], h_coord[n*9//10]
             valid_points = np.logical_and(points_transformed[:,1]>=bottom, points_transformed[:,1]<=top)
             rb = RotatedBox.from_points(points[valid_points, :], 'bb')
             rb.points = points
@@ -250,3 +256,65 @@ class RotatedBox(object):
         else:
             raise ValueError("Unknown parameter value: box_type=%s" % box_type)
 
+    @staticmethod
+    def _principal_components(points):
+        """Computes the principal components of a 2D point cloud in closed form.
+        Returns the mean of the points and a 2x2 matrix, the rows of which are the components, in decreasing order of variance.
+        The result is the same as the mean_ and components_ of a fitted sklearn.decomposition.PCA(2), including the signs of the components
+        (except for the cases where the sign is ambiguous, e.g. when there are several projections with the same largest absolute value).
+
+        >>> mean, components = RotatedBox._principal_components([[0,0], [2,1], [0,1], [2,0]])
+        >>> mean, components
+        (array([1. , 0.5]), array([[-1., -0.],
+               [ 0., -1.]]))
+        """
+        points = np.asfarray(points)
+        mean = points.mean(0)
+        x = points - mean
+        a, b, c = np.dot(x[:,0], x[:,0]), np.dot(x[:,0], x[:,1]), np.dot(x[:,1], x[:,1])
+        # The eigenvectors of the 2x2 scatter matrix [[a, b], [b, c]] are the directions at angle theta and theta + pi/2
+        theta = 0.5*np.arctan2(2*b, a - c)
+        components = np.array([[np.cos(theta), np.sin(theta)], [-np.sin(theta), np.cos(theta)]])
+        # Just like sklearn (see sklearn.utils.extmath.svd_flip), orient each component so that the projection
+        # with the largest absolute value is positive.
+        projections = np.dot(x, components.T)
+        signs = np.sign(projections[np.argmax(np.abs(projections), 0), [0, 1]])
+        signs[signs == 0] = 1
+        return mean, components*signs[:, np.newaxis]
+
+    @staticmethod
+    def _min_area_box(points):
+        """Returns the minimum-area RotatedBox, bounding the given n x 2 array of points (see `from_points`).
+
+        One of the sides of the minimum-area bounding rectangle is always collinear with an edge of the convex hull of the points,
+        hence we only need to try the orientations of the hull edges ("rotating calipers").
+        """
+        from scipy.spatial import ConvexHull
+        try:
+            from scipy.spatial import QhullError
+        except ImportError:  # scipy < 1.8
+            from scipy.spatial.qhull import QhullError
+        try:
+            hull = points[ConvexHull(points).vertices]
+        except (QhullError, ValueError):
+            # All points are on a line, which is its own principal component
+            return RotatedBox.from_points(points, 'bb')
+        edges = np.roll(hull, -1, 0) - hull
+        # As the sides of the box are orthogonal, it suffices to consider the edge angles modulo pi/2
+        angles = np.unique(np.arctan2(edges[:,1], edges[:,0]) % (np.pi/2))
+        directions = np.column_stack([np.cos(angles), np.sin(angles)])
+        # Coordinates of the hull points along each of the directions and the ones orthogonal to them (k x h matrices)
+        u = np.dot(directions, hull.T)
+        v = np.dot(directions[:, [1, 0]]*[-1, 1], hull.T)
+        u_min, u_max, v_min, v_max = u.min(1), u.max(1), v.min(1), v.max(1)
+        best = np.argmin((u_max - u_min)*(v_max - v_min))
+        d, w, h = directions[best], u_max[best] - u_min[best], v_max[best] - v_min[best]
+        center = d*(u_max[best] + u_min[best])/2 + np.array([-d[1], d[0]])*(v_max[best] + v_min[best])/2
+        angle = angles[best]
+        if h > w:
+            # The longer side is the width
+            w, h, angle = h, w, angle + np.pi/2
+        if angle > np.pi/2:
+            angle -= np.pi
+        return RotatedBox(center, width=w, height=h, angle=angle, points=points)
+
@@ -6,10 +6,21 @@ Author: Konstantin Tretyakov
 License: MIT
 '''
 
-from pytesseract import pytesseract
-from scipy.misc import imsave
+import multiprocessing, subprocess, shlex, threading, time, hashlib
+import numpy as np
+from io import BytesIO
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+# NB: pytesseract and PIL are imported within the functions that use them,
+# so that importing this module (e.g. for OCRPool) does not load them.
 
-def ocr(img, mrz_mode=True):
+MRZ_CONFIG = "-psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789>< -c load_system_dawg=F -c load_freq_dawg=F"
+_MRZ_ARGS = shlex.split(MRZ_CONFIG)
+
+
+def ocr(img, mrz_mode=True, engine=None, in_memory=False, timeout=None, cancel=None):
     """Runs Tesseract on a given image. Writes an intermediate tempfile and then runs the tesseract command on the image.
 
     This is a simplified modification of image_to_string from PyTesseract, which is adapted to SKImage rather than PIL.
@@ -17,27 +28,37 @@ def ocr(img, mrz_mode=True):
     In principle we could have reimplemented it just as well - there are some apparent bugs in PyTesseract (e.g. it
     may lose the NamedTemporaryFile due to its auto-delete behaviour).
 
+    :param img: a greyscale image array. uint8 images are passed to tesseract as is, others are scaled to 0..255
+                (see _to_pil).
     :param mrz_mode: when this is True (default) the tesseract is configured to recognize MRZs rather than arbitrary texts.
+    :param engine: a long-lived OCR engine (an OCRPool or a TesseractEngine) to delegate the work to.
+                   When None (default), a new tesseract process is started for this call.
+    :param in_memory: when True, the image is piped to the tesseract process and the text is read from its output
+                      rather than via temporary files. Requires tesseract 3.03 or later.
+    :param timeout: maximum number of seconds the OCR may take. If it takes longer, the tesseract process is killed
+                    and OCRTimeoutError is raised. None (default) means no limit.
+    :param cancel: a threading.Event (or any object with an is_set() method). If it is set, the OCR is not started
+                   or the running tesseract process is killed, and OCRCancelledError is raised.
+                   OCR engines only check it before starting the work.
     """
+    if cancel is not None and cancel.is_set():
+        raise OCRCancelledError("OCR cancelled")
+    if engine is not None:
+        return engine.ocr(img, mrz_mode, timeout)
+    if in_memory:
+        return _ocr_piped(img, mrz_mode, timeout, cancel)
+
+    from pytesseract import pytesseract
     input_file_name = '%s.bmp' % pytesseract.tempnam()
     output_file_name_base = '%s' % pytesseract.tempnam()
     output_file_name = "%s.txt" % output_file_name_base
     try:
-        imsave(input_file_name, img)
+        _to_pil(img).save(input_file_name)
 
+        command = [pytesseract.tesseract_cmd, input_file_name, output_file_name_base]
         if mrz_mode:
-            config = "-psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789>< -c load_system_dawg=F -c load_freq_dawg=F"
-        else:
-            config = None
-
-        status, error_string = pytesseract.run_tesseract(input_file_name,
-                                             output_file_name_base,
-                                             lang=None,
-                                             boxes=False,
-                                             config=config)
-        if status:
-            errors = pytesseract.get_errors(error_string)
-            raise pytesseract.TesseractError(status, errors)
+            command += _MRZ_ARGS
+        _run_tesseract(command, timeout=timeout, cancel=cancel)
         f = open(output_file_name)
         try:
             return f.read().strip()
@@ -46,3 +67,301 @@ def ocr(img, mrz_mode=True):
     finally:
         pytesseract.cleanup(input_file_name)
         pytesseract.cleanup(output_file_name)
+
+
+def ocr_key(img, mrz_mode=True):
+    """Returns a hash of the image pixels along with the OCR configuration, which may be used as a key
+    for memoizing the results of `ocr` (see BoxToMRZ).
+
+    >>> a = np.zeros((2, 3)); b = a.copy(); b[1, 2] = 1.0
+    >>> ocr_key(a) == ocr_key(a.copy()), ocr_key(a) == ocr_key(b), ocr_key(a) == ocr_key(a, False), ocr_key(a) == ocr_key(a.T)
+    (True, False, False, False)
+    """
+    img = np.ascontiguousarray(img)
+    return '%s:%s:%s:%s' % (hashlib.sha1(img.tobytes()).hexdigest(), img.dtype.str, 'x'.join(map(str, img.shape)), mrz_mode)
+
+
+def _ocr_piped(img, mrz_mode=True, timeout=None, cancel=None):
+    """Same as `ocr`, but passes the image to tesseract via stdin and reads the result from stdout, not touching the disk."""
+    command, input_data = _piped_command(img, mrz_mode)
+    return _piped_output(_run_tesseract(command, input_data, timeout, cancel))
+
+
+def _piped_command(img, mrz_mode=True):
+    """Returns the tesseract command line and the data to pipe to its stdin for recognizing the image via pipes."""
+    from pytesseract import pytesseract
+    buf = BytesIO()
+    _to_pil(img).save(buf, 'BMP')
+    command = [pytesseract.tesseract_cmd, 'stdin', 'stdout']
+    if mrz_mode:
+        command += _MRZ_ARGS
+    return command, buf.getvalue()
+
+
+def _to_pil(img):
+    """Converts a greyscale (or RGB/RGBA) image array to an 8-bit PIL image for OCR, the way scipy.misc.toimage (no longer
+    available in recent SciPy versions) did it: uint8 images are taken as is, others are scaled linearly so that their
+    minimum becomes 0 and their maximum 255. The scaling is done in the precision of the image (e.g. float32 for float32 images).
+
+    >>> np.asarray(_to_pil(np.array([[0.25, 0.5], [0.75, 1.0]])))
+    array([[  0,  85],
+           [170, 255]], dtype=uint8)
+    >>> np.asarray(_to_pil(np.array([[3, 200]], dtype=np.uint8)))
+    array([[  3, 200]], dtype=uint8)
+    >>> _to_pil(np.zeros((2, 3, 3))).mode
+    'RGB'
+    """
+    from PIL import Image
+    img = np.asarray(img)
+    if img.dtype != np.uint8:
+        low, high = img.min(), img.max()
+        scale = 255.0/((high - low) or 1)
+        img = ((img - low)*scale).clip(0, 255)
+        img = (img + 0.5).astype(np.uint8)
+    mode = {3: 'RGB', 4: 'RGBA'}.get(img.shape[-1], 'L') if img.ndim == 3 else 'L'
+    return Image.fromarray(np.ascontiguousarray(img), mode)
+
+
+def _piped_output(output):
+    """Converts the stdout of the tesseract command from _piped_command to the recognized text."""
+    if not isinstance(output, str):
+        output = output.decode('utf-8')
+    return output.strip()
+
+
+class OCRTimeoutError(Exception):
+    """Raised when an OCR call did not complete within the allotted time."""
+    pass
+
+
+class OCRCancelledError(Exception):
+    """Raised when an OCR call was cancelled via its `cancel` event."""
+    pass
+
+
+def _run_tesseract(command, input_data=None, timeout=None, cancel=None):
+    """Runs the given tesseract command line, killing it after `timeout` seconds or once `cancel` is set.
+    Returns the contents of its stdout.
+    Raises TesseractError if tesseract fails and OCRTimeoutError or OCRCancelledError if it had to be killed."""
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE if input_data is not None else None,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    done, killed = threading.Event(), []
+    if timeout is not None or cancel is not None:
+        end_time = time.time() + max(timeout, 0) if timeout is not None else None
+        def watch():
+            while not done.is_set():
+                reason = OCRCancelledError if cancel is not None and cancel.is_set() else \
+                         OCRTimeoutError if end_time is not None and time.time() >= end_time else None
+                if reason is not None and proc.poll() is None:
+                    killed.append(reason)
+                    try:
+                        proc.kill()
+                    except OSError:
+                        pass  # The process has just completed by itself
+                    return
+                done.wait(0.02)
+        watcher = threading.Thread(target=watch)
+        watcher.daemon = True
+        watcher.start()
+    try:
+        output, error_string = proc.communicate(input_data)
+    finally:
+        done.set()
+    if killed and killed[0] is OCRTimeoutError:
+        raise OCRTimeoutError("OCR did not complete in %0.2fs" % timeout)
+    elif killed:
+        raise OCRCancelledError("OCR cancelled")
+    if proc.returncode:
+        raise _tesseract_error(proc.returncode, error_string)
+    return output
+
+
+def _tesseract_error(returncode, error_string):
+    """The exception to raise when tesseract exits with a non-zero return code."""
+    from pytesseract import pytesseract
+    return pytesseract.TesseractError(returncode, pytesseract.get_errors(error_string))
+
+
+class TesseractEngine(object):
+    """
+    A persistent in-process Tesseract instance. The trained data is loaded once, on first use,
+    and reused by all subsequent calls, which saves the process startup cost paid by the plain `ocr` function.
+
+    This requires the optional `tesserocr` package. If it is not installed, the engine falls back to
+    the plain `ocr` function (i.e. a tesseract process per call, with the image piped to it in memory),
+    so it is always safe to use.
+
+    An engine instance is thread-safe, but with tesserocr the calls from different threads are serialized, as
+    a Tesseract API recognizes one image at a time. Use OCRPool to run OCR in parallel.
+    """
+
+    def __init__(self):
+        try:
+            import tesserocr
+        except ImportError:
+            tesserocr = None
+        self._tesserocr = tesserocr
+        self._apis = {}
+        self._lock = threading.Lock()  # Guards the APIs: SetImage and GetUTF8Text of one call must not interleave with others
+
+    @property
+    def persistent(self):
+        """True if the engine is backed by an in-process Tesseract API rather than by separate tesseract processes."""
+        return self._tesserocr is not None
+
+    def _api(self, mrz_mode):
+        if mrz_mode not in self._apis:
+            variables = {}
+            if mrz_mode:
+                variables = {'tessedit_char_whitelist': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789><',
+                             'load_system_dawg': 'F', 'load_freq_dawg': 'F'}
+            self._apis[mrz_mode] = self._tesserocr.PyTessBaseAPI(psm=self._tesserocr.PSM.SINGLE_BLOCK, variables=variables)
+        return self._apis[mrz_mode]
+
+    def ocr(self, img, mrz_mode=True, timeout=None):
+        """Same as the `ocr` function. Note that the timeout can only be enforced when running without tesserocr."""
+        if self._tesserocr is None:
+            return ocr(img, mrz_mode, in_memory=True, timeout=timeout)
+        pil_img = _to_pil(img)
+        with self._lock:
+            api = self._api(mrz_mode)
+            api.SetImage(pil_img)
+            return api.GetUTF8Text().strip()
+
+    def close(self):
+        with self._lock:
+            for api in self._apis.values():
+                api.End()
+            self._apis = {}
+
+
+def _ocr_worker_loop(conn):
+    """The main loop of an OCRPool worker process: reads (img, mrz_mode, timeout) requests from conn and sends back
+    (True, text) or (False, exception) responses until a None request is received or the connection is closed."""
+    engine = TesseractEngine()
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            img, mrz_mode, timeout = request
+            try:
+                conn.send((True, engine.ocr(img, mrz_mode, timeout)))
+            except Exception as e:
+                conn.send((False, e))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        engine.close()
+
+
+class _OCRWorker(object):
+    """A single worker process of an OCRPool along with the pipe used to communicate with it."""
+
+    def __init__(self):
+        self._start()
+
+    def _start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_ocr_worker_loop, args=(child_conn,))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.restarts = getattr(self, 'restarts', -1) + 1
+
+    def stop(self, timeout=1.0):
+        try:
+            self.conn.send(None)
+        except (IOError, EOFError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+    def restart(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self._start()
+
+    def ocr(self, img, mrz_mode, timeout=None):
+        if not self.process.is_alive():
+            self.restart()
+        try:
+            self.conn.send((img, mrz_mode, timeout))
+        except (IOError, OSError, EOFError):
+            # The worker died after all (e.g. right after the check above)
+            self.restart()
+            raise RuntimeError("OCR worker process died unexpectedly")
+        # Give the worker a chance to enforce the timeout itself before we kill it
+        if not self.conn.poll(None if timeout is None else timeout + 0.5):
+            # The worker hung. Kill it and start a fresh one in its place.
+            self.restart()
+            raise OCRTimeoutError("OCR did not complete in %0.2fs" % timeout)
+        try:
+            ok, result = self.conn.recv()
+        except EOFError:
+            self.restart()
+            raise RuntimeError("OCR worker process died unexpectedly")
+        if not ok:
+            raise result
+        return result
+
+
+class OCRPool(object):
+    """
+    A pool of long-lived OCR worker processes, each holding its own TesseractEngine.
+    Requests are dispatched to whichever worker is idle, so the pool may be shared between threads
+    and reused across any number of `ocr` calls and documents.
+
+    A worker that does not respond within `timeout` seconds is killed and replaced with a fresh one,
+    and the corresponding call raises OCRTimeoutError. Note that when tesserocr is installed, the workers can not
+    interrupt the OCR themselves (see TesseractEngine.ocr), hence with the default timeout=None a hung worker
+    is never restarted. Set a timeout for long-running pools.
+
+    Usage:
+        with OCRPool(4) as pool:
+            for fn in filenames:
+                mrz = read_mrz(fn, ocr_engine=pool)
+    """
+
+    def __init__(self, size=None, timeout=None):
+        """
+        :param size: the number of worker processes. Defaults to the number of CPUs.
+        :param timeout: maximum number of seconds to wait for a single OCR call. None means no limit.
+        """
+        self.size = size or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self._workers = [_OCRWorker() for i in range(self.size)]
+        self._idle = queue.Queue()
+        for w in self._workers:
+            self._idle.put(w)
+
+    @property
+    def restarts(self):
+        """Total number of times a hung or dead worker had to be restarted."""
+        return sum([w.restarts for w in self._workers])
+
+    def ocr(self, img, mrz_mode=True, timeout=None):
+        """Same as the `ocr` function, but runs on one of the pool's workers.
+        The effective timeout is the smaller of the given one and the pool's."""
+        timeout = min([t for t in [timeout, self.timeout] if t is not None] or [None])
+        worker = self._idle.get()
+        try:
+            return worker.ocr(img, mrz_mode, timeout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """Stops all worker processes."""
+        for w in self._workers:
+            w.stop()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
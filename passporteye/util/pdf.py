@@ -8,13 +8,46 @@ License: MIT
 ## TODO: This uses PDFMiner for Python2. PDFMiner for Python3 has a slightly different interface
 ## hence the code might need to be updated slightly.
 
+import struct, zlib
+from collections import namedtuple
+import numpy as np
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfinterp import PDFResourceManager
-from pdfminer.pdfinterp import PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LTFigure, LTImage
+from pdfminer.pdftypes import PDFStream, resolve1
+
+# An image embedded in a PDF.
+#   page   - the number of the page (starting from 0) where the image is used
+#   name   - the name of the image resource
+#   format - 'jpeg' or 'png' (data is the contents of a JPEG or PNG file) or 'raw' (data is a numpy ndarray with the pixels:
+#            height x width for grayscale and height x width x 3 for color images)
+PDFImage = namedtuple('PDFImage', ['page', 'name', 'format', 'data'])
+
+
+def iter_pdf_images(fstream):
+    """
+    Yields the images (as PDFImage tuples) used on the pages of a given PDF, page by page.
+    The images are found by walking the XObject resources of each page (including the ones nested in form XObjects)
+    rather than by interpreting and laying out the page contents, and the PDF is only parsed as far as the images are requested,
+    so looking for the first image is fast even in large documents.
+
+    JPEG images are returned as is. Flate-compressed PNG-predicted gray and RGB images (which is what PNG files become
+    when embedded into PDFs) are converted to PNG files without decoding. Other uncompressed and Flate-compressed
+    8 bit gray, RGB and CMYK images and 1 bit bitmaps are decoded to arrays. Other kinds of images (CCITT, JBIG2, JPEG2000, indexed colors, ...)
+    are skipped, as are inline images.
+
+    :param fstream: Readable binary stream of the PDF
+    """
+    document = PDFDocument(PDFParser(fstream))
+    for page_no, page in enumerate(PDFPage.create_pages(document)):
+        seen = set()
+        for name, stream in _image_xobjects(page.resources, seen):
+            try:
+                image = _decode_image(stream)
+            except Exception:
+                image = None  # A broken or unsupported image, oh well...
+            if image is not None:
+                yield PDFImage(page_no, name, image[0], image[1])
 
 
 def extract_first_jpeg_in_pdf(fstream):
@@ -25,33 +58,122 @@ def extract_first_jpeg_in_pdf(fstream):
     scanner-produced images around.
     More testing might be needed though.
 
-    Note that in principle there is no serious problem extracting PNGs or other image types from PDFs,
-    however at the moment I do not have enough test data to try this, and the one I have seems to be unsuitable
-    for PDFMiner.
+    See iter_pdf_images for a way to get at the other kinds of images as well.
 
     :param fstream: Readable binary stream of the PDF
     :return: String, containing the whole contents of the JPEG image or None if extraction failed.
     """
-    parser = PDFParser(fstream)
-    document = PDFDocument(parser)
-    rsrcmgr = PDFResourceManager()
-    device = PDFPageAggregator(rsrcmgr)
-    interpreter = PDFPageInterpreter(rsrcmgr, device)
-    for page in PDFPage.create_pages(document):
-        interpreter.process_page(page)
-        layout = device.result
-        for el in layout:
-            if isinstance(el, LTFigure):
-                for im in el:
-                    if isinstance(im, LTImage):
-                        # Found one!
-                        st = None
-                        try:
-                            imdata = im.stream.get_data()
-                        except:
-                            # Failed to decode (seems to happen nearly always - there's probably a bug in PDFMiner), oh well...
-                            imdata = im.stream.get_rawdata()
-                        if imdata is not None and imdata.startswith('\xff\xd8\xff\xe0'):
-                            return imdata
-
-    return None
\ No newline at end of file
+    for image in iter_pdf_images(fstream):
+        if image.format == 'jpeg':
+            return image.data
+    return None
+
+
+def _name(obj):
+    """The name of a PDF name object (a PSLiteral) as a str, or None if obj is not one."""
+    name = getattr(resolve1(obj), 'name', None)
+    if isinstance(name, bytes) and not isinstance(name, str):
+        name = name.decode('latin-1')
+    return name
+
+
+def _image_xobjects(resources, seen):
+    """Yields (name, stream) pairs for the image XObjects in the given resource dictionary, recursing into form XObjects.
+    `seen` is the set of ids of the already visited XObjects, which protects from yielding an image twice (and from cycles)."""
+    resources = resolve1(resources)
+    if not isinstance(resources, dict):
+        return
+    xobjects = resolve1(resources.get('XObject'))
+    if not isinstance(xobjects, dict):
+        return
+    for name in sorted(xobjects.keys()):
+        stream = resolve1(xobjects[name])
+        if not isinstance(stream, PDFStream) or id(stream) in seen:
+            continue
+        seen.add(id(stream))
+        subtype = _name(stream.get('Subtype'))
+        if subtype == 'Image':
+            yield name, stream
+        elif subtype == 'Form':
+            for item in _image_xobjects(stream.get('Resources'), seen):
+                yield item
+
+
+def _decode_image(stream):
+    """Returns ('jpeg', data), ('png', data) or ('raw', ndarray) for an image XObject stream,
+    or None if the image kind is not supported."""
+    filters = [_name(f) for f in stream.get_filters()]
+    png = _as_png(stream, filters)
+    if png is not None:
+        return 'png', png
+    if filters and filters[-1] in ('DCTDecode', 'DCT'):
+        # PDFMiner does not decode JPEG data, so we take care of the filters ourselves
+        data = stream.get_rawdata()
+        if data is None:
+            return None
+        if stream.decipher:
+            data = stream.decipher(stream.objid, stream.genno, data)
+        for f in filters[:-1]:
+            if f in ('FlateDecode', 'Fl'):
+                data = zlib.decompress(data)
+            else:
+                return None
+        return ('jpeg', data) if data.startswith(b'\xff\xd8\xff') else None
+    elif all([f in ('FlateDecode', 'Fl') for f in filters]):
+        return 'raw', _raw_image(stream, stream.get_data())
+    return None
+
+
+def _colors(stream):
+    """The number of color components of an image XObject, or None if its color space is not supported."""
+    colorspace = resolve1(stream.get('ColorSpace'))
+    if isinstance(colorspace, list) and len(colorspace) == 2 and _name(colorspace[0]) == 'ICCBased':
+        return int(resolve1(resolve1(colorspace[1]).get('N', 3)))
+    return {'DeviceGray': 1, 'CalGray': 1, 'DeviceRGB': 3, 'CalRGB': 3, 'DeviceCMYK': 4}.get(_name(colorspace))
+
+
+def _as_png(stream, filters):
+    """If the image XObject is Flate-compressed with a PNG predictor, its data is exactly the IDAT data of a PNG file
+    (and it usually comes from one). In this case returns the contents of that PNG file, so that it can be decoded by
+    the image libraries. Otherwise returns None."""
+    params = resolve1(stream.get_any(('DP', 'DecodeParms'), {}))
+    if filters not in (['FlateDecode'], ['Fl']) or not isinstance(params, dict) or resolve1(stream.get('ImageMask')):
+        return None
+    width, height = int(resolve1(stream.get('Width'))), int(resolve1(stream.get('Height')))
+    bits, colors = int(resolve1(stream.get('BitsPerComponent', 8))), _colors(stream)
+    if int(resolve1(params.get('Predictor', 1))) < 10 or colors not in (1, 3) or \
+            int(resolve1(params.get('Colors', 1))) != colors or int(resolve1(params.get('Columns', 1))) != width or \
+            int(resolve1(params.get('BitsPerComponent', 8))) != bits or bits not in (1, 2, 4, 8, 16):
+        return None
+    data = stream.get_rawdata()
+    if data is None:
+        return None
+    if stream.decipher:
+        data = stream.decipher(stream.objid, stream.genno, data)
+    def chunk(kind, content):
+        return struct.pack('>I', len(content)) + kind + content + struct.pack('>I', zlib.crc32(kind + content) & 0xffffffff)
+    header = struct.pack('>IIBBBBB', width, height, bits, 0 if colors == 1 else 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', data) + chunk(b'IEND', b'')
+
+
+def _raw_image(stream, data):
+    """Converts decoded image XObject data to an ndarray. Returns None for unsupported color spaces and bit depths."""
+    width, height = int(resolve1(stream.get('Width'))), int(resolve1(stream.get('Height')))
+    bits, colors = int(resolve1(stream.get('BitsPerComponent', 8))), _colors(stream)
+    if resolve1(stream.get('ImageMask')):
+        colors, bits = 1, 1
+    if colors is None or bits not in (1, 8):
+        return None
+
+    pixels = np.frombuffer(data, dtype=np.uint8)
+    row_bytes = (width*colors*bits + 7)//8
+    pixels = pixels[:row_bytes*height].reshape(height, row_bytes)
+    if bits == 1:
+        # Each row is padded to a whole byte. Note that 1 means white both in DeviceGray and (by default) in image masks.
+        pixels = np.unpackbits(pixels, axis=1)[:, :width*colors]*np.uint8(255)
+    pixels = pixels.reshape(height, width, colors)
+    if colors == 4:
+        # A naive CMYK -> RGB conversion, sufficient for our purposes
+        k = 255 - pixels[:, :, 3:].astype(np.int32)
+        pixels = ((255 - pixels[:, :, :3].astype(np.int32))*k//255).astype(np.uint8)
+    return pixels[:, :, 0] if colors == 1 else pixels
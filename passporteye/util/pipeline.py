@@ -4,6 +4,15 @@ PassportEye::Util: Pipeline utility
 Author: Konstantin Tretyakov
 License: MIT
 '''
+import copy, sys, time
+from collections import Counter, OrderedDict
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# CPU time of the current process (time.clock is the Python 2 way of getting it on Unix)
+_cpu_time = getattr(time, 'process_time', None) or time.clock
 
 
 class Pipeline(object):
@@ -37,6 +46,47 @@ class Pipeline(object):
     (4, 0)
     >>> a['d']
     0
+
+    The pipeline keeps track of the number of runs, wall and CPU time spent in each component, as well as any
+    custom counters incremented by the components themselves via the `count` method.
+    Callables added via `add_hook` are notified after each component run (e.g. to export the timings to a metrics system).
+
+    >>> a.stats['components']['s,d']['calls'], a.stats['components']['sd']['calls']
+    (2, 2)
+    >>> log = []
+    >>> a.add_hook(lambda p, name, walltime, cputime: log.append(name))
+    >>> a.count('my_counter', 3)
+    >>> a.replace_component('2', lambda: 3, ['b'], [])
+    >>> a['c'], log, a.stats['counters']['my_counter']
+    (5, ['2', 's,d'], 3)
+
+    Several keys may be computed at once. The components are run in an order consistent with their dependencies
+    (precomputed once for the whole graph), and, given an executor, the independent ones are run concurrently:
+
+    >>> from multiprocessing.pool import ThreadPool
+    >>> a.replace_component('2', lambda: 4, ['b'], [])
+    >>> pool = ThreadPool(2)
+    >>> a.compute(['d', 'e'], executor=pool)
+    [-2, (6, -2)]
+    >>> pool.terminate()
+    >>> a.add_component('loop', lambda x: x, ['f'], ['g'])
+    >>> a.add_component('pool', lambda x: x, ['g'], ['f'])
+    >>> a['g']
+    Traceback (most recent call last):
+    ...
+    Exception: Cyclic dependency between the components: loop, pool
+
+    A pipeline may serve as a template for any number of runs on different inputs (see `bind`). The runs share
+    the components of the template, each keeping just its own data and statistics:
+
+    >>> t = Pipeline()
+    >>> t.add_component('double', lambda x: 2*x, ['y'], ['x'])
+    >>> runs = [t.bind(x=1), t.bind(x=2)]
+    >>> runs[0]['y'], runs[1]['y'], 'y' in t.data
+    (2, 4, False)
+    >>> runs[1].replace_component('double', lambda x: 3*x, ['y'], ['x'])  # Does not affect the template or the other runs
+    >>> runs[1]['y'], t.bind(x=2)['y'], runs[0].stats['components']['double']['calls']
+    (6, 4, 1)
     """
 
     def __init__(self):
@@ -45,6 +95,13 @@ class Pipeline(object):
         self.provides = dict()    # Component name -> provides list
         self.depends = dict()     # Component name -> depends list
         self.whoprovides = dict() # key -> component name
+        self.stats = {'components': OrderedDict(),  # Component name -> {'calls': ..., 'walltime': ..., 'cputime': ...}
+                      'counters': Counter()}        # Custom counters, see count()
+        self.hooks = []           # Callables notified after each component run, see add_hook()
+        self.dependents = dict()  # key -> names of the components which depend on it
+        self._order = None        # Component names in topological order (computed when needed, see _plan)
+        self._version = 0         # Incremented on every change of the graph or invalidation of data
+        self._shared = False      # Whether the graph (components, provides, ...) is shared with other runs, see bind()
         self.data['__data__'] = self.data
         self.data['__pipeline__'] = self
 
@@ -59,23 +116,43 @@ class Pipeline(object):
         for p in provides:
             if p in self.whoprovides:
                 raise Exception("There is already a component that provides %s" % p)
+        self._own_graph()
         self.provides[name] = provides
         self.depends[name] = depends
         self.components[name] = callable
         for p in provides:
             self.whoprovides[p] = name
+        for d in depends:
+            self.dependents.setdefault(d, set()).add(name)
+        self._order = None
+        self._version += 1
+
+    def add_hook(self, hook):
+        """
+        Add a callable which will be invoked as hook(pipeline, component_name, walltime, cputime) after each run of a component.
+        """
+        self.hooks.append(hook)
+
+    def count(self, counter, n=1):
+        """Increment a named counter in self.stats['counters'] by n. Meant to be used by the components."""
+        self.stats['counters'][counter] += n
 
     def remove_component(self, name):
         """Removes an existing component with a given name, invalidating all the values computed by
         the previous component."""
         if name not in self.components:
             raise Exception("No component named %s" % name)
+        self._own_graph()
         del self.components[name]
+        for d in self.depends[name]:
+            self.dependents[d].discard(name)
         del self.depends[name]
         for p in self.provides[name]:
             del self.whoprovides[p]
             self.invalidate(p)
         del self.provides[name]
+        self._order = None
+        self._version += 1
 
     def replace_component(self, name, callable, provides=None, depends=None):
         """Changes an existing component with a given name, invalidating all the values computed by
@@ -83,17 +160,49 @@ class Pipeline(object):
         self.remove_component(name)
         self.add_component(name, callable, provides, depends)
 
+    def bind(self, **data):
+        """
+        Returns a new run of this pipeline: a pipeline sharing the components (and their precomputed state) with this one,
+        but keeping its own data, initialized with the data of this pipeline and the given values, as well as its own
+        statistics and hooks. Binding is cheap, so a pipeline may be set up once and then run on many inputs.
+
+        A run which modifies its components (see replace_component) gets its own copy of the component graph first.
+        Note that the runs share the component objects, so these must be thread-safe for the runs to be used in parallel.
+        """
+        if self._order is None:
+            self._order = self._topological_order()  # So that the runs need not compute it
+        run = copy.copy(self)
+        self._shared = run._shared = True
+        run.data = dict(self.data)
+        run.data['__data__'] = run.data
+        run.data['__pipeline__'] = run
+        run.stats = {'components': OrderedDict(), 'counters': Counter()}
+        run.hooks = list(self.hooks)
+        run._version = 0
+        for k, v in data.items():
+            run.invalidate(k)
+            run.data[k] = v
+        return run
+
+    def _own_graph(self):
+        """Makes a private copy of the component graph if it is shared with other runs, before it is modified."""
+        if self._shared:
+            self.components, self.provides, self.depends = dict(self.components), dict(self.provides), dict(self.depends)
+            self.whoprovides = dict(self.whoprovides)
+            self.dependents = dict([(k, set(v)) for k, v in self.dependents.items()])
+            self._shared = False
+
     def invalidate(self, key):
         """Remove the given data item along with all items that depend on it in the graph."""
-        if key not in self.data:
-            return
-        del self.data[key]
-
-        # Find all components that used it and invalidate their results
-        for cname in self.components:
-            if key in self.depends[cname]:
-                for downstream_key in self.provides[cname]:
-                    self.invalidate(downstream_key)
+        stack = [key]
+        while stack:
+            key = stack.pop()
+            if key in self.data:
+                del self.data[key]
+                self._version += 1
+                # Invalidate the results of all components that used it
+                for cname in self.dependents.get(key, ()):
+                    stack.extend(self.provides[cname])
 
     def __setitem__(self, key, value):
         self.data[key] = value
@@ -104,14 +213,139 @@ class Pipeline(object):
 
     def _compute(self, key):
         if key not in self.data:
-            cname = self.whoprovides[key]
-            for d in self.depends[cname]:
-                self._compute(d)
-            inputs = [self.data[d] for d in self.depends[cname]]
-            results = self.components[cname](*inputs)
-            if len(self.provides[cname]) == 1:
-                self.data[self.provides[cname][0]] = results
+            self.compute([key])
+
+    def compute(self, keys, executor=None):
+        """
+        Computes the given keys (unless they are already computed), returns the list of their values.
+
+        :param executor: when given, independent components are run concurrently on this executor
+                         (a concurrent.futures.Executor or a multiprocessing.pool.ThreadPool). The components which
+                         access the pipeline itself (depend on __pipeline__ or __data__) are still run one at a time,
+                         in the calling thread, as are the hooks.
+        """
+        if executor is None:
+            version = None
+            while True:
+                if version != self._version:
+                    # (Re)plan, as the components may have changed the pipeline (see TryOtherMaxWidth)
+                    version = self._version
+                    plan = iter(self._plan(keys))
+                cname = next(plan, None)
+                if cname is None:
+                    break
+                if any([p not in self.data for p in self.provides[cname]]):
+                    self._store(cname, *self._run(cname, [self.data[d] for d in self.depends[cname]]))
+        else:
+            self._compute_concurrently(keys, executor)
+        return [self.data[k] for k in keys]
+
+    def _plan(self, keys):
+        """Returns the names of the components which need to be run to compute the given keys, in the order to run them."""
+        needed, stack = set(), [k for k in keys if k not in self.data]
+        while stack:
+            cname = self.whoprovides[stack.pop()]
+            if cname not in needed:
+                needed.add(cname)
+                stack.extend([d for d in self.depends[cname] if d not in self.data])
+        if self._order is None:
+            self._order = self._topological_order()
+        return [c for c in self._order if c in needed]
+
+    def _topological_order(self):
+        """Orders all components so that each one goes after the components it depends on (Kahn's algorithm)."""
+        upstream = dict((c, set([self.whoprovides[d] for d in self.depends[c] if d in self.whoprovides])) for c in self.components)
+        ready = sorted([c for c in upstream if not upstream[c]], reverse=True)
+        order, seen = [], set(ready)
+        while ready:
+            cname = ready.pop()
+            order.append(cname)
+            for p in self.provides[cname]:
+                for c in self.dependents.get(p, ()):
+                    upstream[c].discard(cname)
+                    if not upstream[c] and c not in seen:
+                        seen.add(c)
+                        ready.append(c)
+        if len(order) < len(self.components):
+            raise Exception("Cyclic dependency between the components: %s" % ', '.join(sorted(set(self.components) - set(order))))
+        return order
+
+    def _exclusive(self, cname):
+        """Does the component access the pipeline itself (and hence may not run concurrently with the others)?"""
+        return '__pipeline__' in self.depends[cname] or '__data__' in self.depends[cname]
+
+    def _compute_concurrently(self, keys, executor):
+        done = queue.Queue()  # (name, results of _run or None, exception or None) of the completed components
+        def task(cname, inputs):
+            try:
+                done.put((cname, self._run(cname, inputs), None))
+            except BaseException:
+                done.put((cname, None, sys.exc_info()[1]))
+
+        version, running = None, 0
+        while True:
+            if version != self._version:
+                # (Re)plan. This only happens after exclusive components, i.e. when nothing else is running
+                version = self._version
+                plan = self._plan(keys)
+                planned = set(plan)
+                waiting = OrderedDict((c, set([self.whoprovides[d] for d in self.depends[c] if self.whoprovides.get(d) in planned]))
+                                      for c in plan)
+            if not waiting and not running:
+                break
+            ready = [c for c in waiting if not waiting[c]]
+            for cname in ready:
+                if not self._exclusive(cname):
+                    del waiting[cname]
+                    args = (cname, [self.data[d] for d in self.depends[cname]])
+                    if hasattr(executor, 'submit'):
+                        executor.submit(task, *args)
+                    else:
+                        executor.apply_async(task, args)
+                    running += 1
+            if not running:
+                cname = ready[0]  # Exclusive, has to run on its own
+                del waiting[cname]
+                self._store(cname, *self._run(cname, [self.data[d] for d in self.depends[cname]]))
             else:
-                for k, v in zip(self.provides[cname], results):
-                    self.data[k] = v
+                cname, result, error = done.get()
+                running -= 1
+                if error is not None:
+                    self._drain(done, running)
+                    raise error
+                self._store(cname, *result)
+            for deps in waiting.values():
+                deps.discard(cname)
+
+    def _drain(self, done, running):
+        """Waits for the `running` components still submitted by _compute_concurrently after a failure, so that none of
+        them is left working on the pipeline behind the caller's back. Stores the results of those that succeed."""
+        while running:
+            cname, result, error = done.get()
+            running -= 1
+            if error is None:
+                self._store(cname, *result)
+
+    def _run(self, cname, inputs):
+        """Runs the component on the given inputs. Returns (results, walltime, cputime)."""
+        tic, cpu_tic = time.time(), _cpu_time()
+        results = self.components[cname](*inputs)
+        return results, time.time() - tic, _cpu_time() - cpu_tic
+
+    def _store(self, cname, results, walltime, cputime):
+        """Stores the results of a component run, records its statistics."""
+        if len(self.provides[cname]) == 1:
+            self.data[self.provides[cname][0]] = results
+        else:
+            for k, v in zip(self.provides[cname], results):
+                self.data[k] = v
+        self._record_run(cname, walltime, cputime)
 
+    def _record_run(self, cname, walltime, cputime):
+        """Note that the times include any computations the component requested from the pipeline itself (see TryOtherMaxWidth)."""
+        st = self.stats['components'].setdefault(cname, {'calls': 0, 'walltime': 0.0, 'cputime': 0.0})
+        st['calls'] += 1
+        st['walltime'] += walltime
+        st['cputime'] += cputime
+        for hook in self.hooks:
+            hook(self, cname, walltime, cputime)
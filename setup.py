@@ -45,9 +45,12 @@ setup(name='PassportEye',
       packages=find_packages(exclude=['examples', 'tests']),
       include_package_data=True,
       zip_safe=False,
-      install_requires=['pdfminer', 'numpy', 'scipy', 'scikit-image >= 0.12.1', 'scikit-learn', 'matplotlib', 'pytesseract'],
+      install_requires=['pdfminer', 'numpy', 'scipy', 'scikit-image >= 0.12.1', 'matplotlib', 'pytesseract'],
       entry_points={
           'console_scripts': ['evaluate_mrz=passporteye.mrz.scripts:evaluate_mrz',
-                              'mrz=passporteye.mrz.scripts:mrz']
+                              'mrz=passporteye.mrz.scripts:mrz',
+                              'passporteye-bench=passporteye.mrz.scripts:bench_mrz',
+                              'generate_mrz=passporteye.mrz.scripts:generate_mrz',
+                              'mrz-batch=passporteye.mrz.scripts:mrz_batch']
       }
 )
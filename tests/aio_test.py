@@ -0,0 +1,18 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import os, subprocess, sys
+import pytest
+
+
+# The asyncio module may be imported before mrz.image (which imports it in turn)
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="The asyncio interface requires Python 3.5+")
+def test_import_aio_first():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import passporteye.mrz.aio as aio, passporteye.mrz.image as image; assert image.read_mrz_async is aio.read_mrz_async'
+    subprocess.check_call([sys.executable, '-c', code], cwd=root)
@@ -0,0 +1,34 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import numpy as np
+from skimage import measure
+from passporteye.mrz.image import MRZBoxLocator
+
+
+# The contours found component by component must be exactly the ones of find_contours
+def test_component_contours():
+    rng = np.random.RandomState(0)
+    for density in [0.0, 0.05, 0.2, 0.4, 1.0]:
+        img = rng.rand(60, 80) < density
+        img[20:25, 10:70] = True  # A "line of text", touching some of the noise
+        key = lambda c: (len(c), tuple(c[0]), tuple(c[-1]))
+        expected = sorted([key(c) for c in measure.find_contours(img, 0.5)])
+        assert sorted([key(c) for c in MRZBoxLocator._contours(img)]) == expected
+        large = [c for c in measure.find_contours(img, 0.5) if np.prod(c.max(0) - c.min(0)) >= 100]
+        assert set([key(c) for c in large]) <= set([key(c) for c in MRZBoxLocator._contours(img, 100)])
+
+
+def test_box_locator():
+    img = np.zeros((100, 200), dtype=bool)
+    img[40:45, 20:180] = True
+    img[50:55, 20:170] = True
+    img[10:30, 10:30] = True
+    boxes = MRZBoxLocator()(img)
+    assert len(boxes) == 1  # The two lines are merged, the square is not a box
+    assert abs(boxes[0].center[0] - 47) < 1 and boxes[0].width > 150  # (The points are given as (row, column))
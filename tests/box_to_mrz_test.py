@@ -0,0 +1,71 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import threading, time
+import numpy as np
+from passporteye.mrz.image import BoxToMRZ, FindFirstValidMRZ
+from passporteye.util.geometry import RotatedBox
+from passporteye.util.pipeline import Pipeline
+
+
+class CountingEngine(object):
+    """An OCR engine which recognizes nothing, counting the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def ocr(self, img, mrz_mode=True, timeout=None):
+        self.calls += 1
+        return ''
+
+
+# Once the deadline has passed no OCR is started at all, and the skipped methods are reported as truncated
+def test_box_to_mrz_deadline():
+    engine = CountingEngine()
+    box_to_mrz = BoxToMRZ(ocr_engine=engine, ocr_memo=False)
+    roi, trace, truncated = np.random.RandomState(0).rand(20, 100), [], []
+    deadline = time.time() - 1
+    assert box_to_mrz._ocr(roi, 'direct', trace, deadline, truncated) == ''
+    assert box_to_mrz._fallback_result('rescaled(3)', {'': roi}, trace, deadline, truncated, None) is None
+    assert box_to_mrz._fallback_result('rescaled(1)', {'': roi}, trace, deadline, None, None) is None
+    assert engine.calls == 0 and trace == [] and truncated == ['direct', 'rescaled(3)']
+    assert box_to_mrz._ocr(roi, 'direct', trace, time.time() + 60, truncated) == '' and engine.calls == 1
+
+
+class SlowEngine(object):
+    """An OCR engine which recognizes an invalid MRZ slowly, recording the largest number of simultaneous calls."""
+
+    def __init__(self):
+        self.running = self.max_running = self.calls = 0
+        self.lock = threading.Lock()
+
+    def ocr(self, img, mrz_mode=True, timeout=None):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return 'P<UTOERIKSSON<<ANNA<MARIA'
+
+
+# All the boxes and their fallback methods share the threads, with at most `workers` OCR calls at a time
+def test_find_first_valid_mrz_workers():
+    engine = SlowEngine()
+    find_mrz = FindFirstValidMRZ(ocr_engine=engine, workers=3, ocr_memo=False)
+    rs = np.random.RandomState(0)
+    boxes = [RotatedBox((20 + 40*i, 100), 180, 20, 0.0) for i in range(4)]
+    img = rs.rand(200, 200)
+    pipeline = Pipeline()
+    pipeline.add_component('loader', lambda: img, ['img'], [])
+    data = {'__pipeline__': pipeline}
+    box_idx, roi, text, mrz = find_mrz(boxes, img, 1.0, data)
+    assert engine.calls == 4*(1 + len(BoxToMRZ.FALLBACKS))
+    assert engine.max_running == 3
+    assert mrz is None or not mrz.valid
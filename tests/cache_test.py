@@ -0,0 +1,32 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import shutil
+from pkg_resources import resource_filename
+from passporteye.mrz.image import read_mrz, read_mrz_batch
+from passporteye.util.cache import MemoryCache, DiskCache
+
+
+# The results are cached by file contents, so a copy of the same file is a hit. "No MRZ" (None) is cached as well.
+def test_read_mrz_cache(tmpdir):
+    src = resource_filename(__name__, 'data/pacman.png')
+    copy = str(tmpdir.join('copy.png'))
+    shutil.copyfile(src, copy)
+    for cache in [MemoryCache(), DiskCache(str(tmpdir.join('cache.db')))]:
+        assert read_mrz(src, cache=cache) is None
+        assert read_mrz(copy, cache=cache) is None
+        assert read_mrz(copy, save_roi=True, cache=cache) is None
+        assert cache.stats['hits'] == 1 and cache.stats['misses'] == 2 and cache.stats['size'] == 2
+
+
+def test_read_mrz_batch_disk_cache(tmpdir):
+    src = resource_filename(__name__, 'data/pacman.png')
+    cache = DiskCache(str(tmpdir.join('cache.db')))
+    results = list(read_mrz_batch([src]*4, workers=2, cache=cache))
+    assert all([r.error is None and r.mrz is None for r in results])
+    assert len(cache) == 1
@@ -0,0 +1,99 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+from io import BytesIO
+import numpy as np
+from pkg_resources import resource_filename
+from skimage.io import imread
+from passporteye.mrz.image import Loader
+
+
+# Filenames, file contents, streams and image arrays must all give the same image
+def test_loader_sources():
+    for fn in ['data/pacman.png', 'data/pacman.jpg', 'data/pdf-with-jpg.pdf', 'data/pdf-with-png.pdf']:
+        fn = resource_filename(__name__, fn)
+        with open(fn, 'rb') as f:
+            data = f.read()
+        img = Loader(fn)()
+        assert img is not None and img.ndim == 2
+        assert np.all(Loader(data)() == img) and np.all(Loader(bytearray(data))() == img)
+        assert np.all(Loader(BytesIO(data))() == img)
+        if not fn.endswith('.pdf'):
+            assert np.all(Loader(imread(fn))() == img)
+    assert np.all(Loader(resource_filename(__name__, 'data/pdf-with-png.pdf'))() == Loader(resource_filename(__name__, 'data/pacman.png'))())
+    assert Loader(BytesIO(open(resource_filename(__name__, 'data/pdf-with-none.pdf'), 'rb').read()))() is None
+
+
+# The reduced JPEG decoding must give (nearly) the same small image as scaling the full one, and leave the source intact
+def test_loader_draft():
+    from passporteye.mrz.image import Scaler
+    fn = resource_filename(__name__, 'data/pacman.jpg')
+    img_small, scale_factor = Scaler(100)(Loader(fn)())
+    with open(fn, 'rb') as f:
+        stream = BytesIO(f.read())
+    for source in [fn, stream]:
+        draft, draft_scale_factor = Loader(source).load_draft(100)
+        assert draft_scale_factor == scale_factor and draft.shape == img_small.shape
+        assert np.abs(draft - img_small).mean() < 0.05
+    assert stream.tell() == 0 and np.all(Loader(stream)() == Loader(fn)())
+    assert Loader(resource_filename(__name__, 'data/pacman.png')).load_draft(100) is None
+    assert Loader(fn).load_draft(10000) is None
+
+
+# The compact pixel types give the same image, up to the precision
+def test_loader_dtype():
+    for fn in ['data/pacman.png', 'data/pacman.jpg', 'data/pdf-with-jpg.pdf']:
+        fn = resource_filename(__name__, fn)
+        img = Loader(fn)()
+        img_uint8, img_float32 = Loader(fn, dtype=np.uint8)(), Loader(fn, dtype=np.float32)()
+        assert img_uint8.dtype == np.uint8 and img_float32.dtype == np.float32
+        assert img_uint8.shape == img.shape and img_float32.shape == img.shape
+        if img.dtype == np.uint8:
+            img = img/255.0
+        assert np.abs(img_uint8/255.0 - img).max() <= 0.5/255 + 1e-6
+        assert np.abs(img_float32 - img).max() < 1e-5
+
+
+# Memory-mapped images are the same as the 8-bit (or single precision) ones, whatever the file format
+def test_loader_mmap():
+    import os, shutil, tempfile
+    from PIL import Image
+    from passporteye.mrz.image import _map_raw
+    tmp = tempfile.mkdtemp()
+    try:
+        filenames = [resource_filename(__name__, fn) for fn in ['data/pacman.png', 'data/pacman.jpg', 'data/pdf-with-jpg.pdf']]
+        im = Image.open(filenames[0]).convert('RGB')
+        for mode in ['RGB', 'L']:
+            for ext in ['tif', 'bmp', 'ppm']:
+                # Uncompressed files, which are mapped directly
+                filenames.append(os.path.join(tmp, '%s.%s' % (mode, ext)))
+                im.convert(mode).save(filenames[-1])
+                assert _map_raw(filenames[-1], Image.open(filenames[-1])) is not None
+        for fn in filenames:
+            for dtype in [np.uint8, np.float32]:
+                img = Loader(fn, dtype=dtype, mmap=True)()
+                assert img.dtype == dtype and np.array_equal(img, Loader(fn, dtype=dtype)())
+            with open(fn, 'rb') as f:
+                stream = BytesIO(f.read())
+            assert np.array_equal(Loader(stream, mmap=True)(), Loader(fn, dtype=np.uint8)())
+    finally:
+        shutil.rmtree(tmp)
+
+
+# With jpeg_draft the full image is not decoded at all when no MRZ box is found on the draft
+def test_jpeg_draft_no_boxes():
+    from PIL import Image, ImageDraw
+    from passporteye.mrz.image import MRZPipeline
+    f = BytesIO()
+    page = Image.new('L', (3000, 4000), 255)
+    for x, y in [(500, 600), (2000, 1500), (1200, 3000)]:
+        ImageDraw.Draw(page).ellipse((x, y, x + 60, y + 60), fill=0)  # Dots, which are nothing like an MRZ
+    page.save(f, 'JPEG')
+    p = MRZPipeline(f.getvalue(), jpeg_draft=True)
+    assert p['mrz_final'] is None and p['boxes'] == []
+    assert 'img' not in p.data and 'loader' not in p.stats['components']
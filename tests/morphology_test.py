@@ -0,0 +1,39 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import glob, os
+import numpy as np
+from skimage import morphology
+from passporteye.util import morphology as fast_morphology
+from passporteye.mrz.image import MRZPipeline, BoxToMRZ, BooneTransform
+
+
+# The fast morphology must give exactly the results of skimage on the images BooneTransform and BoxToMRZ work with
+def test_morphology_exact():
+    files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'passporteye', 'mrz', 'testdata', '*.*')))
+    square, disk = morphology.square(5), morphology.disk(5)
+    for fn in files[::3]:
+        p = MRZPipeline(fn)
+        img = p['img_small']
+        for f in ['black_tophat', 'closing']:
+            assert np.array_equal(getattr(fast_morphology, f)(img, square), getattr(morphology, f)(img, square))
+        for box in p['boxes'][:1]:
+            roi = box.extract_from_image(p['img'], 1.0/p['scale_factor'])
+            roi = BoxToMRZ()._larger_image(roi) if roi.shape[1] <= 700 else roi
+            assert np.array_equal(fast_morphology.black_tophat(roi, disk), morphology.black_tophat(roi, disk))
+        assert np.array_equal(BooneTransform(fast_morphology=False)(img), p['img_binary'])
+
+
+def test_morphology_dtypes():
+    rng = np.random.RandomState(0)
+    for img in [rng.rand(40, 7), rng.rand(5, 60).astype(np.float32), (rng.rand(33, 33)*255).astype(np.uint8), rng.rand(20, 20) > 0.5]:
+        for selem in [morphology.square(3), morphology.disk(4), morphology.rectangle(1, 5), morphology.diamond(2)]:
+            for f in ['dilation', 'erosion', 'closing', 'black_tophat']:
+                expected = getattr(morphology, f)(img, selem)
+                result = getattr(fast_morphology, f)(img, selem)
+                assert result.dtype == expected.dtype and np.array_equal(result, expected)
@@ -0,0 +1,63 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+from passporteye.mrz.image import read_mrz_batch
+
+
+# Errors must be reported per item rather than interrupt the batch, and the ordered mode must preserve the input order
+def test_read_mrz_batch_errors():
+    sources = ['no-such-file-%d.png' % i for i in range(10)]
+    for executor in ['thread', 'process']:
+        results = list(read_mrz_batch(sources, workers=3, executor=executor, max_in_flight=4))
+        assert [r.index for r in results] == list(range(10))
+        assert [r.source for r in results] == sources
+        assert all([r.mrz is None and r.error is not None and r.walltime >= 0 for r in results])
+        results = list(read_mrz_batch(sources, workers=3, executor=executor, ordered=False))
+        assert sorted([r.index for r in results]) == list(range(10))
+
+
+# mrz-batch: the inputs are found in directories and lists, and a run interrupted after some files is resumed
+# from the checkpoint without processing them again
+def test_run_mrz_batch(tmpdir):
+    import json, os, shutil
+    from pkg_resources import resource_filename
+    from passporteye.mrz.scripts import iter_batch_inputs, run_mrz_batch
+    tmp = str(tmpdir)
+    os.makedirs(os.path.join(tmp, 'images', 'sub'))
+    for fn in ['a.png', 'notes.txt', os.path.join('sub', 'b.PNG')]:
+        shutil.copyfile(resource_filename(__name__, 'data/pacman.png'), os.path.join(tmp, 'images', fn))
+    with open(os.path.join(tmp, 'list.txt'), 'w') as f:
+        f.write('no-such-file.png\n\n')
+    sources = list(iter_batch_inputs([os.path.join(tmp, 'images')], [os.path.join(tmp, 'list.txt')]))
+    assert sources == [os.path.join(tmp, 'images', 'a.png'), os.path.join(tmp, 'images', 'sub', 'b.PNG'), 'no-such-file.png']
+
+    output_fn, checkpoint = os.path.join(tmp, 'output.ndjson'), os.path.join(tmp, 'checkpoint')
+    with open(checkpoint, 'w') as f:
+        f.write(sources[0] + '\n')
+    for expected in [dict(processed=2, errors=1, skipped=1), dict(skipped=3)]:
+        with open(output_fn, 'a') as output:
+            stats = run_mrz_batch(iter(sources), output, checkpoint, workers=2, executor='thread')
+        assert stats == expected
+    with open(output_fn) as f:
+        results = [json.loads(line) for line in f]
+    assert sorted([r['filename'] for r in results]) == sources[1:]
+    assert [r['valid_score'] for r in results] == [0, 0] and [('error' in r) for r in results].count(True) == 1
+    with open(checkpoint) as f:
+        assert sorted(f.read().split()) == sorted(sources)
+
+
+# Items which can not be passed to the worker processes are reported as errors rather than lost (which would hang the batch)
+def test_read_mrz_batch_unpicklable():
+    from pkg_resources import resource_filename
+    fn = resource_filename(__name__, 'data/pacman.png')
+    with open(fn, 'rb') as f:
+        sources = [fn, f]
+        results = list(read_mrz_batch(sources, workers=1, executor='process'))
+    assert [r.source for r in results] == sources and [r.error is None for r in results] == [True, False]
+    results = list(read_mrz_batch([fn, fn], workers=1, executor='process', hooks=[lambda *args: None]))
+    assert [r.error is not None for r in results] == [True, True]
@@ -7,7 +7,7 @@ Author: Konstantin Tretyakov
 License: MIT
 '''
 from pkg_resources import resource_filename
-from passporteye.util.ocr import ocr
+from passporteye.util.ocr import ocr, OCRPool
 from skimage.io import imread
 
 
@@ -24,4 +24,37 @@ def test_ocr():
     assert s.endswith('The quick\nbrown dog jumped over the lazy fox.')
 
     s = ocr_file('tesseract-test1.jpg', True)
-    assert s.startswith('T116 10111610 1111011111 110111')
\ No newline at end of file
+    assert s.startswith('T116 10111610 1111011111 110111')
+
+
+# Smoke test for the persistent OCR worker pool
+def test_ocr_pool():
+    img = imread(resource_filename('tests', 'data/tesseract-test2.png'))
+    with OCRPool(2) as pool:
+        assert ocr(img, False, engine=pool) == ocr(img, False)
+        assert ocr(img, True, engine=pool) == ocr(img, True)
+        assert pool.restarts == 0
+
+
+# The in-memory (piped) OCR path must give the same results as the tempfile-based one
+def test_ocr_in_memory():
+    for fn in ['tesseract-test1.jpg', 'tesseract-test2.png']:
+        img = imread(resource_filename('tests', 'data/%s' % fn))
+        assert ocr(img, False, in_memory=True) == ocr(img, False)
+        assert ocr(img, True, in_memory=True) == ocr(img, True)
+
+
+# A worker which dies just before a request is sent to it must be restarted, and the call must fail cleanly
+def test_ocr_pool_dead_worker():
+    import numpy as np
+    with OCRPool(1) as pool:
+        worker = pool._workers[0]
+        worker.process.terminate()
+        worker.process.join()
+        worker.process.is_alive = lambda: True  # As if it died right after the check
+        try:
+            pool.ocr(np.zeros((10, 10)))
+            assert False, "RuntimeError expected"
+        except RuntimeError:
+            pass
+        assert pool.restarts == 1 and worker.process.is_alive()
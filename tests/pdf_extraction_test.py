@@ -18,4 +18,22 @@ def test_extract_jpeg():
                           ('pdf-with-none.pdf',False)]:
         with open(resource_filename('tests', 'data/%s' % fn), 'rb') as f:
             img = extract_first_jpeg_in_pdf(f)
-            assert (len(img) == 5805) if has_image else (img is None)
\ No newline at end of file
+            assert (len(img) == 5805) if has_image else (img is None)
+
+# The images of all kinds are found, PNG ones are passed on losslessly
+def test_iter_pdf_images():
+    from skimage.io import imread
+    from io import BytesIO
+    from passporteye.util.pdf import iter_pdf_images
+    png = imread(resource_filename('tests', 'data/pacman.png'))
+    for fn, formats in [('pdf-with-jpg.pdf', ['jpeg']),
+                        ('pdf-with-png.pdf', ['png']),
+                        ('pdf-with-pngjpg.pdf', ['png', 'jpeg']),
+                        ('pdf-with-none.pdf', [])]:
+        with open(resource_filename('tests', 'data/%s' % fn), 'rb') as f:
+            images = list(iter_pdf_images(f))
+        assert [img.format for img in images] == formats
+        assert all([img.page == 0 for img in images])
+        for img in images:
+            if img.format == 'png':
+                assert (imread(BytesIO(img.data)) == png[:, :, :3]).all()
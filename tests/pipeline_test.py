@@ -0,0 +1,36 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import time
+import pytest
+from multiprocessing.pool import ThreadPool
+from passporteye.util.pipeline import Pipeline
+
+
+def _fail():
+    raise ValueError("failed")
+
+
+def _slow():
+    time.sleep(0.2)
+    return 1
+
+
+# When a component fails in concurrent mode, the error is raised only after the other running components are done
+def test_compute_concurrently_error():
+    p = Pipeline()
+    p.add_component('fail', _fail, ['a'], [])
+    p.add_component('slow', _slow, ['b'], [])
+    pool = ThreadPool(2)
+    try:
+        with pytest.raises(ValueError):
+            p.compute(['a', 'b'], executor=pool)
+        assert p.data['b'] == 1 and 'a' not in p.data
+        assert p.stats['components']['slow']['calls'] == 1
+    finally:
+        pool.terminate()
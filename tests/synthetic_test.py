@@ -0,0 +1,30 @@
+'''
+Test module for use with py.test.
+Write each test as a function named test_<something>.
+Read more here: http://pytest.org/
+
+Author: Konstantin Tretyakov
+License: MIT
+'''
+import numpy as np
+from passporteye.mrz.text import MRZ
+from passporteye.mrz.synthetic import MRZ_TYPES, random_mrz_lines, generate_mrz_documents
+from passporteye.mrz.image import MRZPipeline
+
+
+def test_random_mrz_lines():
+    rng = np.random.RandomState(42)
+    for i in range(200):
+        mrz_type = MRZ_TYPES[i % len(MRZ_TYPES)]
+        mrz = MRZ.from_ocr('\n'.join(random_mrz_lines(mrz_type, rng)))
+        assert mrz.valid and mrz.mrz_type == mrz_type
+
+
+def test_generate_mrz_documents():
+    docs = list(generate_mrz_documents(3, seed=1, rotation=(-5, 5), scale=(0.7, 1.0), noise=0.02, blur=0.5))
+    assert len(docs) == 3
+    again = list(generate_mrz_documents(3, seed=1, rotation=(-5, 5), scale=(0.7, 1.0), noise=0.02, blur=0.5))
+    for (lines, img), (lines2, img2) in zip(docs, again):
+        assert lines == lines2 and np.all(img == img2)
+        # The MRZ is found on the page (the OCR is not checked here as it depends on the fonts available)
+        assert len(MRZPipeline(img)['boxes']) > 0